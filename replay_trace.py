@@ -0,0 +1,134 @@
+"""
+Replays a recorded request trace (CTRL_AI_TRACE=1, see src/trace_recorder.py) against
+AIHandler with offline fake providers: same arrival pattern, modes, instruction
+classes, input sizes and repeats. A fake stands in under each provider name the
+routing rules and the trace use, so cache, routing and the client-side rate limits
+(CTRL_AI_<PROVIDER>_RPM / _TPM) behave as in real use.
+Runs headless (no GUI, no network, no API keys).
+
+    python replay_trace.py trace.jsonl --speed 10 --base-ms 300 --ms-per-output-tok 5
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# No real providers and no forced route (it would bypass the routing rules);
+# set before AIHandler loads .env, which never overrides existing variables
+for name in ("GEMINI_API_KEY", "GROQ_API_KEY", "CTRL_AI_PROVIDER"):
+    os.environ[name] = ""
+os.environ["CTRL_AI_TRACE"] = "0"  # Don't record the replay itself
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from ai_handler import AIHandler
+from providers import FakeProvider
+from trace_recorder import read_trace
+
+# A representative keyword per instruction class, so routing sees the same class
+CLASS_KEYWORDS = {"edit": "fix grammar", "format": "format as list", "translate": "translate",
+                  "rewrite": "rewrite", "reason": "explain", "other": "process"}
+
+
+def synthetic_text(text_id, size):
+    """Deterministic filler of the recorded size; equal ids give equal texts."""
+    rng = random.Random(text_id)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+    out, length = [], 0
+    while length < size:
+        word = rng.choice(words)
+        out.append(word)
+        length += len(word) + 1
+    return " ".join(out)[:size]
+
+
+def synthetic_instruction(record):
+    return f"{CLASS_KEYWORDS.get(record.get('class'), 'process')} {record.get('instr_id', '')}"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="trace.jsonl (rotated backups next to it are included)")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression factor (0 = no gaps)")
+    parser.add_argument("--threads", type=int, default=16, help="max requests in flight")
+    parser.add_argument("--base-ms", type=float, default=0.0)
+    parser.add_argument("--ms-per-input-ktok", type=float, default=0.0)
+    parser.add_argument("--ms-per-output-tok", type=float, default=0.0)
+    args = parser.parse_args()
+
+    records = sorted(read_trace(args.trace), key=lambda r: r.get("ts", 0))
+    if not records:
+        print("No records in trace.")
+        sys.exit(1)
+
+    ai = AIHandler()
+    names = {c["provider"] for rule in ai.router.rules for c in rule.get("candidates", [])}
+    names |= {r["provider"] for r in records if r.get("provider")}
+    names.discard("mock")
+    for name in sorted(names):
+        ai.register_provider(FakeProvider(args.base_ms, args.ms_per_input_ktok, args.ms_per_output_tok,
+                                          name=name, remote=name != "local"))
+    # Same primary as a real setup with a Gemini key
+    ai.provider = "gemini" if "gemini" in ai.providers else sorted(names)[0]
+
+    latencies = {}  # mode -> [ms]
+    errors = []
+    lock = threading.Lock()
+
+    def one_request(record):
+        text = synthetic_text(record.get("text_id", ""), record.get("in_chars", 0))
+        instruction = synthetic_instruction(record)
+        mode = record.get("mode", "commander")
+        start = time.perf_counter()
+        try:
+            if mode == "follow_up":
+                ai.explain_follow_up(text, instruction)
+            else:
+                ai.process_text(text, mode=mode, prompt_instruction=instruction)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+            return
+        with lock:
+            latencies.setdefault(mode, []).append((time.perf_counter() - start) * 1000)
+
+    print(f"Replaying {len(records)} requests (speed x{args.speed or 'max'})...")
+    first_ts = records[0].get("ts", 0)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for record in records:
+            if args.speed > 0:
+                due = (record.get("ts", first_ts) - first_ts) / args.speed
+                delay = due - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(one_request, record)
+    elapsed = time.perf_counter() - start
+
+    print(f"Done in {elapsed:.1f}s ({len(records) / elapsed:.1f} req/s), errors: {len(errors)}")
+    for mode, values in sorted(latencies.items()):
+        print(f"  {mode:<10} n={len(values):<6} p50={percentile(values, 50):7.1f} ms  "
+              f"p95={percentile(values, 95):7.1f} ms  max={max(values):7.1f} ms")
+    if ai.cache is not None:
+        recorded = {}
+        for record in records:
+            outcome = record.get("cache")
+            if outcome:
+                recorded[outcome] = recorded.get(outcome, 0) + 1
+        print(f"Cache: replay {ai.cache.hits}  recorded {recorded}")
+    for name, stats in sorted(ai.rate_limit_stats().items()):
+        print(f"Rate limit {name}: {stats}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Soak test: fires thousands of fake-provider requests through AIHandler and checks that
+memory stays flat. Runs headless (no GUI, no network, no API keys).
+
+    python soak.py --requests 5000 --threads 8 --max-growth-mb 20
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# Force the offline fake provider before AIHandler reads the environment
+os.environ["CTRL_AI_PROVIDER"] = "fake"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from ai_handler import AIHandler
+from memory_monitor import get_rss_bytes
+
+INSTRUCTIONS = ["Fix grammar", "fix the grammar", "Make professional", "Translate to Spanish",
+                "Summarize", "Make it shorter", "Convert to bullet points"]
+QUESTIONS = ["What does this do?", "Why is this slow?", "Explain this regex"]
+
+
+def make_text(rng, i):
+    # Unique texts so the caches fill up and have to evict
+    size = rng.choice([40, 400, 4000, 40000])
+    return f"[{i}] " + ("lorem ipsum dolor sit amet " * (size // 27 + 1))[:size]
+
+
+def one_request(ai, rng, i):
+    text = make_text(rng, i)
+    if rng.random() < 0.7:
+        ai.process_text(text, mode="commander", prompt_instruction=rng.choice(INSTRUCTIONS))
+    else:
+        ai.process_text(text, mode="explain", prompt_instruction=rng.choice(QUESTIONS))
+        if rng.random() < 0.5:
+            ai.explain_follow_up(text, rng.choice(QUESTIONS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--max-growth-mb", type=float, default=20.0)
+    args = parser.parse_args()
+
+    ai = AIHandler()
+    rng = random.Random(1234)
+
+    def run(count, offset):
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            for future in [pool.submit(one_request, ai, random.Random(rng.random()), offset + i)
+                           for i in range(count)]:
+                future.result()
+
+    print(f"Warmup: {args.warmup} requests...")
+    run(args.warmup, 0)
+    tracemalloc.start()
+    baseline_rss = get_rss_bytes()
+    baseline_traced, _ = tracemalloc.get_traced_memory()
+
+    print(f"Soak: {args.requests} requests on {args.threads} threads...")
+    start = time.perf_counter()
+    run(args.requests, args.warmup)
+    elapsed = time.perf_counter() - start
+
+    traced, peak = tracemalloc.get_traced_memory()
+    rss_growth = (get_rss_bytes() - baseline_rss) / 2**20
+    traced_growth = (traced - baseline_traced) / 2**20
+    print(f"Done in {elapsed:.1f}s ({args.requests / elapsed:.0f} req/s)")
+    print(f"RSS growth: {rss_growth:+.1f} MB  traced growth: {traced_growth:+.1f} MB  "
+          f"traced peak: {peak / 2**20:.1f} MB")
+    print(f"Cache entries: {len(ai.cache) if ai.cache is not None else 0}  "
+          f"Explain sessions: {len(ai.explain_sessions)}")
+
+    # Traced growth is the precise signal; RSS also catches native leaks
+    if traced_growth > args.max_growth_mb or rss_growth > args.max_growth_mb * 2:
+        print("FAIL: memory is not flat.")
+        sys.exit(1)
+    print("OK: memory stayed flat.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import os
+import time
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from app_config import log_dir
+
+# Finished results longer than this are sent back in several messages, so
+# one huge answer is never pickled into a single giant pipe message. This is
+# chunked transfer only: providers are not streamed, so the first chunk
+# arrives once the whole answer is ready.
+TRANSFER_CHUNK_CHARS = 64 * 1024
+
+# AIHandler methods the main process may call
+WORKER_METHODS = {"process_text", "explain_follow_up", "release_memory", "warm", "provider_names",
+                  "reload_config", "rate_limit_stats"}
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+# ===========================================================================
+#  Worker process
+# ===========================================================================
+def _worker_main(conn, log_path, max_parallel):
+    """
+    Entry point of the worker process: owns the AIHandler (and with it the
+    provider SDKs) and serves requests from the pipe on a thread pool.
+    """
+    logging.basicConfig(filename=log_path, level=logging.DEBUG,
+                        format='%(asctime)s [worker] %(message)s')
+    from ai_handler import AIHandler
+    from memory_monitor import get_rss_bytes
+
+    ai = AIHandler()
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def serve(req_id, method, args, kwargs):
+        try:
+            value = getattr(ai, method)(*args, **kwargs)
+        except Exception as e:
+            send(("error", req_id, f"{type(e).__name__}: {e}"))
+            return
+        if isinstance(value, str) and len(value) > TRANSFER_CHUNK_CHARS:
+            for i in range(0, len(value), TRANSFER_CHUNK_CHARS):
+                send(("chunk", req_id, value[i:i + TRANSFER_CHUNK_CHARS]))
+            value = None
+        send(("done", req_id, value, get_rss_bytes()))
+
+    logging.info(f"AI worker {os.getpid()} ready.")
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break  # Main process went away
+            if message is None:
+                break  # Shutdown
+            req_id, method, args, kwargs = message
+            if method not in WORKER_METHODS:
+                send(("error", req_id, f"ValueError: unknown method {method!r}"))
+                continue
+            pool.submit(serve, req_id, method, args, kwargs)
+    logging.info(f"AI worker {os.getpid()} exiting.")
+
+
+# ===========================================================================
+#  Main-process side
+# ===========================================================================
+class _Pending:
+    def __init__(self):
+        self.event = threading.Event()
+        self.chunks = []
+        self.value = None
+        self.error = None
+
+
+class _Worker:
+    """One worker process plus the reader thread that routes its replies."""
+
+    def __init__(self, context, max_parallel):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, name="CtrlAI-AIWorker", daemon=True,
+                                       args=(child_conn, os.path.join(log_dir(), "debug.log"), max_parallel))
+        self.process.start()
+        child_conn.close()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.served = 0
+        self.rss = 0
+        self.retiring = False
+        self.alive = True
+        threading.Thread(target=self._read, name="AIWorkerReader", daemon=True).start()
+
+    def submit(self, req_id, method, args, kwargs):
+        pending = _Pending()
+        with self.lock:
+            if not self.alive:
+                raise WorkerCrashed("AI worker is not running")
+            self.pending[req_id] = pending
+        try:
+            with self.send_lock:
+                self.conn.send((req_id, method, args, kwargs))
+        except (OSError, ValueError) as e:
+            with self.lock:
+                self.pending.pop(req_id, None)
+            raise WorkerCrashed(f"AI worker pipe closed: {e}")
+        return pending
+
+    def _read(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            kind, req_id = message[0], message[1]
+            with self.lock:
+                pending = self.pending.get(req_id)
+            if pending is None:
+                continue
+            if kind == "chunk":
+                pending.chunks.append(message[2])
+                continue
+            if kind == "done":
+                value, self.rss = message[2], message[3]
+                pending.value = "".join(pending.chunks) if pending.chunks else value
+            else:
+                pending.error = RuntimeError(message[2])
+            with self.lock:
+                self.pending.pop(req_id, None)
+                self.served += 1
+                idle = not self.pending
+            pending.event.set()
+            if self.retiring and idle:
+                self.stop()
+        self._fail_pending(WorkerCrashed(f"AI worker exited (code {self.process.exitcode})"))
+
+    def _fail_pending(self, error):
+        with self.lock:
+            self.alive = False
+            pending, self.pending = list(self.pending.values()), {}
+        for p in pending:
+            p.error = error
+            p.event.set()
+
+    def stop(self, timeout=2.0):
+        """Asks the worker to exit; kills it if it does not."""
+        with self.lock:
+            self.alive = False
+        try:
+            with self.send_lock:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        threading.Thread(target=self._reap, args=(timeout,), daemon=True).start()
+
+    def kill(self):
+        with self.lock:
+            self.alive = False
+        self.process.kill()
+
+    def _reap(self, timeout):
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class AIWorkerClient:
+    """
+    Drop-in replacement for AIHandler that runs it in a separate process
+    (CTRL_AI_WORKER_PROCESS=1), so SDK imports, network I/O and JSON parsing
+    never compete with the Tk loop and the keyboard hook for the GIL.
+
+    Requests are multiplexed over one pipe and served concurrently by the
+    worker. The worker is started on first use, restarted automatically if it
+    crashes (in-flight requests are retried once), and recycled after
+    CTRL_AI_WORKER_MAX_REQUESTS requests or when its RSS exceeds
+    CTRL_AI_WORKER_MAX_MB, to contain leaks in the SDKs.
+    """
+
+    def __init__(self, max_requests=None, max_rss_mb=None, timeout=None):
+        self.max_requests = max_requests or int(os.getenv("CTRL_AI_WORKER_MAX_REQUESTS", "500"))
+        max_rss_mb = max_rss_mb or float(os.getenv("CTRL_AI_WORKER_MAX_MB", "600"))
+        self.max_rss_bytes = int(max_rss_mb * 2**20)
+        self.timeout = timeout or float(os.getenv("CTRL_AI_WORKER_TIMEOUT", "180"))
+        self.max_parallel = int(os.getenv("CTRL_AI_MAX_PARALLEL", "4"))
+        # Spawn everywhere: no forked Tk or hook state. Spawn re-runs main.py as
+        # __mp_main__, which is why main.py loads its GUI/hotkey imports only under __main__
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._worker = None
+        self._ids = itertools.count(1)
+        self.restarts = 0
+        self._provider_names = None
+
+    def start(self):
+        """Starts the worker ahead of the first request (optional)."""
+        self._current_worker()
+
+    def _current_worker(self):
+        with self._lock:
+            worker = self._worker
+            if worker is not None and worker.alive and not worker.retiring:
+                return worker
+            if worker is not None and not worker.alive and not worker.retiring:
+                self.restarts += 1
+                logging.warning(f"[Worker] AI worker died; restarting (#{self.restarts}).")
+            start = time.perf_counter()
+            self._worker = _Worker(self._context, self.max_parallel)
+            logging.info(f"[Worker] AI worker {self._worker.process.pid} started "
+                         f"in {(time.perf_counter() - start) * 1000:.0f} ms.")
+            return self._worker
+
+    def _call(self, method, *args, **kwargs):
+        for attempt in (1, 2):
+            worker = self._current_worker()
+            try:
+                pending = worker.submit(next(self._ids), method, args, kwargs)
+            except WorkerCrashed:
+                if attempt == 2:
+                    raise
+                continue
+            if not pending.event.wait(self.timeout):
+                logging.error(f"[Worker] {method} timed out after {self.timeout:.0f}s; killing worker.")
+                worker.kill()
+                raise TimeoutError(f"AI worker did not answer within {self.timeout:.0f}s")
+            self._maybe_recycle(worker)
+            if isinstance(pending.error, WorkerCrashed) and attempt == 1:
+                print(f"[Worker] {pending.error}. Retrying on a new worker.")
+                continue
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+    def _maybe_recycle(self, worker):
+        if worker.retiring or not worker.alive:
+            return
+        if worker.served >= self.max_requests or worker.rss > self.max_rss_bytes:
+            logging.info(f"[Worker] Recycling AI worker {worker.process.pid} "
+                         f"({worker.served} requests, {worker.rss / 2**20:.0f} MB).")
+            worker.retiring = True  # New requests go to a fresh worker; this one drains
+            with worker.lock:
+                idle = not worker.pending
+            if idle:
+                worker.stop()
+
+    # --- AIHandler interface ---
+    def process_text(self, text, mode="commander", prompt_instruction=None, route=None):
+        return self._call("process_text", text, mode=mode, prompt_instruction=prompt_instruction,
+                          route=route)
+
+    def explain_follow_up(self, text, question):
+        return self._call("explain_follow_up", text, question)
+
+    def warm(self, prompt_instruction, route=None):
+        return self._call("warm", prompt_instruction, route=route)
+
+    def provider_names(self):
+        # Fixed once the worker's AIHandler is set up; ask only once
+        if self._provider_names is None:
+            self._provider_names = self._call("provider_names")
+        return self._provider_names
+
+    def reload_config(self):
+        return self._call("reload_config")
+
+    def rate_limit_stats(self):
+        return self._call("rate_limit_stats")
+
+    def release_memory(self):
+        """Recycles the worker: the cheapest way to return all of its memory."""
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.retiring = True
+            with worker.lock:
+                idle = not worker.pending
+            if idle:
+                worker.stop()
+
+    def close(self):
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.stop()
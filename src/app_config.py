@@ -0,0 +1,51 @@
+import os
+import sys
+import json
+import logging
+
+
+def app_dir():
+    """
+    Folder for user-editable config and learned state.
+    Next to the .exe when bundled (like .env), the repo root when run from source.
+    """
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def config_path(name):
+    return os.path.join(app_dir(), name)
+
+
+def load_json(name, default=None):
+    """Loads a JSON file from app_dir(). Returns default if missing or invalid."""
+    path = config_path(name)
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning(f"Could not read {name}: {e}")
+        return default
+
+
+def save_json(name, data):
+    """Writes a JSON file to app_dir() atomically. Errors are logged, not raised."""
+    path = config_path(name)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.warning(f"Could not write {name}: {e}")
+
+
+def log_dir():
+    """Folder of the active log file (debug.log), used for reports and profiles."""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.FileHandler):
+            return os.path.dirname(handler.baseFilename)
+    return os.getcwd()
@@ -1,6 +1,11 @@
+import os
 import time
+import ctypes
+import logging
+import shutil
 import platform
 import threading
+import subprocess
 import pyperclip
 try:
     from pynput.keyboard import Key, Controller
@@ -13,7 +18,218 @@ try:
 except ImportError:
     keyboard_lib = None
 
+# Optional: AT-SPI accessibility bindings (Linux desktops)
+try:
+    import pyatspi
+except ImportError:
+    pyatspi = None
+
+# Optional: UI Automation through comtypes (Windows)
+try:
+    import comtypes
+    import comtypes.client
+except ImportError:
+    comtypes = None
+
+# Used when the focused window cannot be queried on this platform
+FOCUS_FALLBACK_DELAY = 0.2
+
+def get_foreground_window():
+    """
+    Returns an opaque handle for the currently focused window, or None if the
+    platform does not let us query it.
+    """
+    system = platform.system()
+    try:
+        if system == "Windows":
+            return ctypes.windll.user32.GetForegroundWindow() or None
+        elif system == "Linux" and shutil.which("xdotool"):
+            out = subprocess.run(["xdotool", "getactivewindow"], capture_output=True,
+                                 text=True, timeout=0.2)
+            return int(out.stdout.strip()) if out.returncode == 0 else None
+    except Exception:
+        pass
+    return None
+
+def wait_for_focus(target, timeout=0.5, poll=0.01):
+    """
+    Blocks until the target window is focused again. Call this from a worker
+    thread, never the UI thread. Falls back to a fixed delay when focus cannot
+    be observed. Returns True if focus was confirmed.
+    """
+    if target is None:
+        time.sleep(FOCUS_FALLBACK_DELAY)
+        return False
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if get_foreground_window() == target:
+            return True
+        time.sleep(poll)
+    return False
+
+def wait_for_input_idle(target, timeout=2.0, settle=0.02, idle_ms=10.0):
+    """
+    Blocks until the target window has caught up with the input sent to it:
+    its thread must answer a no-op message (WM_NULL) within `idle_ms`, i.e.
+    it is no longer busy handling e.g. a paste. Windows only. Returns the
+    seconds waited, or None if idleness cannot be observed or the timeout
+    passed (callers then fall back to a fixed delay).
+    """
+    if target is None or platform.system() != "Windows":
+        return None
+    user32 = ctypes.windll.user32
+    start = time.monotonic()
+    time.sleep(settle)  # Let the keystrokes reach the target's input queue
+    while time.monotonic() - start < timeout:
+        result = ctypes.c_size_t()
+        sent = time.monotonic()
+        # WM_NULL with SMTO_ABORTIFHUNG: returns once the target's thread pumps messages again
+        if not user32.SendMessageTimeoutW(target, 0x0000, 0, 0, 0x0002,
+                                          int(timeout * 1000), ctypes.byref(result)):
+            return None  # Hung or gone
+        if (time.monotonic() - sent) * 1000 < idle_ms:
+            return time.monotonic() - start
+        time.sleep(settle)
+    return None
+
+def get_focused_app():
+    """
+    Returns a short identifier (process name) for the focused application, or
+    None if it cannot be determined. Used to cache per-app strategies.
+    """
+    system = platform.system()
+    try:
+        if system == "Windows":
+            user32 = ctypes.windll.user32
+            kernel32 = ctypes.windll.kernel32
+            pid = ctypes.c_ulong()
+            user32.GetWindowThreadProcessId(user32.GetForegroundWindow(), ctypes.byref(pid))
+            handle = kernel32.OpenProcess(0x1000, False, pid.value)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle:
+                return None
+            try:
+                buf = ctypes.create_unicode_buffer(260)
+                size = ctypes.c_ulong(260)
+                if kernel32.QueryFullProcessImageNameW(handle, 0, buf, ctypes.byref(size)):
+                    return os.path.basename(buf.value).lower()
+            finally:
+                kernel32.CloseHandle(handle)
+        elif system == "Linux" and shutil.which("xdotool"):
+            out = subprocess.run(["xdotool", "getactivewindow", "getwindowpid"],
+                                 capture_output=True, text=True, timeout=0.2)
+            if out.returncode == 0:
+                with open(f"/proc/{out.stdout.strip()}/comm") as f:
+                    return f.read().strip()
+    except Exception:
+        pass
+    return None
+
+# --- Capture strategies (fastest first) ---
+# Each returns the selected text or "" and must not touch the clipboard,
+# except the final "clipboard" strategy. Only sources that report the live
+# selection qualify: the X11/Wayland PRIMARY selection is not one of them,
+# since it keeps the last text selected anywhere after the user deselects.
+_capture_strategy_cache = {}  # focused app -> strategy name that worked last
+
+def _capture_via_atspi():
+    """Reads the selection of the focused accessible text widget via AT-SPI."""
+    if pyatspi is None:
+        return ""
+    try:
+        desktop = pyatspi.Registry.getDesktop(0)
+        for app in desktop:
+            if app is None:
+                continue
+            # Only walk the active window; full-tree searches are slow
+            frame = next((w for w in app if w is not None
+                          and w.getState().contains(pyatspi.STATE_ACTIVE)), None)
+            if frame is None:
+                continue
+            focused = pyatspi.findDescendant(
+                frame, lambda acc: acc.getState().contains(pyatspi.STATE_FOCUSED))
+            if focused is None:
+                return ""
+            text_iface = focused.queryText()
+            if text_iface.getNSelections() > 0:
+                start, end = text_iface.getSelection(0)
+                return text_iface.getText(start, end)
+            return ""
+    except Exception as e:
+        logging.debug(f"[Capture] AT-SPI failed: {e}")
+    return ""
+
+_uia_local = threading.local()  # COM objects are per thread
+
+def _uia_client():
+    client = getattr(_uia_local, "client", None)
+    if client is None:
+        comtypes.CoInitialize()  # Capture runs on the hotkey worker, not the importing thread
+        comtypes.client.GetModule("UIAutomationCore.dll")
+        from comtypes.gen.UIAutomationClient import CUIAutomation, IUIAutomation
+        client = _uia_local.client = comtypes.client.CreateObject(CUIAutomation, interface=IUIAutomation)
+    return client
+
+def _capture_via_uia():
+    """Reads the selection of the focused element via UI Automation's TextPattern."""
+    if comtypes is None:
+        return ""
+    try:
+        client = _uia_client()
+        # Generated by _uia_client() on first use
+        from comtypes.gen.UIAutomationClient import UIA_TextPatternId, IUIAutomationTextPattern
+        pattern = client.GetFocusedElement().GetCurrentPattern(UIA_TextPatternId)
+        if not pattern:
+            return ""  # Not a text control (or it doesn't expose its text)
+        ranges = pattern.QueryInterface(IUIAutomationTextPattern).GetSelection()
+        return "".join(ranges.GetElement(i).GetText(-1) for i in range(ranges.Length))
+    except Exception as e:
+        logging.debug(f"[Capture] UI Automation failed: {e}")
+    return ""
+
+def _available_capture_strategies():
+    strategies = []
+    if platform.system() == "Linux":
+        if pyatspi is not None:
+            strategies.append("atspi")
+    elif platform.system() == "Windows":
+        if comtypes is not None:
+            strategies.append("uia")
+    strategies.append("clipboard")
+    return strategies
+
 def capture_selection(timeout=0.5):
+    """
+    Captures the currently selected text.
+    Tries accessibility first (AT-SPI on Linux, UI Automation on Windows: the
+    focused widget's actual selection range) and only falls back to the
+    simulated Ctrl+C clipboard round trip when needed.
+    The strategy that works is remembered per focused application.
+    """
+    app = get_focused_app()
+    cached = _capture_strategy_cache.get(app)
+    if cached:
+        # Trust the cached tier; only the clipboard remains as a fallback
+        order = [cached] if cached == "clipboard" else [cached, "clipboard"]
+    else:
+        order = _available_capture_strategies()
+
+    for name in order:
+        start = time.perf_counter()
+        if name == "atspi":
+            text = _capture_via_atspi()
+        elif name == "uia":
+            text = _capture_via_uia()
+        else:
+            text = _capture_via_clipboard(timeout)
+        if text:
+            _capture_strategy_cache[app] = name
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            logging.debug(f"[Capture] {name} for '{app}' in {elapsed_ms:.0f} ms")
+            return text
+    return ""
+
+def _capture_via_clipboard(timeout=0.5):
     """
     Captures the currently selected text by manipulating the clipboard.
     """
@@ -89,14 +305,18 @@ def capture_selection(timeout=0.5):
 
 def paste_text(text):
     """
-    Pastes the given text at the current cursor location.
+    Pastes the given text at the current cursor location via the clipboard.
+    Callers are responsible for making sure the target app has focus
+    (see paste_backends).
     """
     pyperclip.copy(text)
+    send_paste_keys()
+
+def send_paste_keys():
+    """Sends the platform's paste shortcut (Ctrl+V / Cmd+V)."""
     system = platform.system()
-    
+
     if system == "Linux" and keyboard_lib:
-        # Important: Wait a split second for focus to return if triggered by UI
-        time.sleep(0.1) 
         keyboard_lib.send('ctrl+v')
     elif keyboard_controller:
         if system == "Darwin":
@@ -107,3 +327,14 @@ def paste_text(text):
         with keyboard_controller.pressed(modifier):
             keyboard_controller.press('v')
             keyboard_controller.release('v')
+    else:
+        raise RuntimeError("No keyboard controller available.")
+
+def type_text(text):
+    """Types the text as individual key events (no clipboard involved)."""
+    if keyboard_controller:
+        keyboard_controller.type(text)
+    elif keyboard_lib:
+        keyboard_lib.write(text)
+    else:
+        raise RuntimeError("No keyboard controller available.")
@@ -0,0 +1,92 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from instruction_cache import text_hash
+
+
+class ExplainSession:
+    """
+    Ephemeral context for follow-up questions about one selection.
+    Not chat history: it lives in memory only and expires after a TTL.
+    provider_state holds provider-side handles (e.g. a Gemini context cache)
+    and cleanup callbacks run when the session is evicted.
+    """
+
+    def __init__(self, text, max_turns):
+        self.text = text
+        self.key = text_hash(text)
+        self.turns = []  # [(question, answer)]
+        self.max_turns = max_turns
+        self.provider_state = {}
+        self.cleanups = []
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+    def add_turn(self, question, answer):
+        self.turns.append((question, answer))
+        # Keep the most recent turns only; the selection itself is always kept
+        del self.turns[:-self.max_turns]
+        self.last_used = time.monotonic()
+
+    def close(self):
+        for cleanup in self.cleanups:
+            try:
+                cleanup()
+            except Exception as e:
+                logging.debug(f"[Explain] Session cleanup failed: {e}")
+        self.cleanups = []
+        self.provider_state.clear()
+
+
+class ExplainSessionStore:
+    """LRU of ExplainSessions keyed by selection hash, bounded by count, size and TTL."""
+
+    def __init__(self, ttl=None, max_sessions=None, max_chars=None, max_turns=None):
+        self.ttl = ttl or float(os.getenv("CTRL_AI_EXPLAIN_TTL", "600"))
+        self.max_sessions = max_sessions or int(os.getenv("CTRL_AI_EXPLAIN_SESSIONS", "8"))
+        self.max_chars = max_chars or int(os.getenv("CTRL_AI_EXPLAIN_MAX_CHARS", "400000"))
+        self.max_turns = max_turns or 10
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, text):
+        key = text_hash(text)
+        with self._lock:
+            self._purge_expired()
+            session = self._sessions.get(key)
+            if session is None:
+                session = ExplainSession(text, self.max_turns)
+                self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            session.last_used = time.monotonic()
+            self._enforce_limits()
+            return session
+
+    def get(self, text):
+        with self._lock:
+            self._purge_expired()
+            return self._sessions.get(text_hash(text))
+
+    def clear(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for key in [k for k, s in self._sessions.items() if now - s.last_used > self.ttl]:
+            self._sessions.pop(key).close()
+
+    def _enforce_limits(self):
+        # Oldest first, but never evict the session that was just touched
+        while len(self._sessions) > 1 and (
+                len(self._sessions) > self.max_sessions
+                or sum(len(s.text) for s in self._sessions.values()) > self.max_chars):
+            _, session = self._sessions.popitem(last=False)
+            session.close()
@@ -1,7 +1,9 @@
 ﻿import customtkinter as ctk
 import pyperclip
 import threading
+import logging
 import time
+from clipboard_utils import wait_for_focus
 
 # Set appearance mode and default color theme
 ctk.set_appearance_mode("Dark")
@@ -30,6 +32,8 @@ _FONT_BTN      = ("Segoe UI", 13, "bold")
 
 
 class OverlayApp(ctk.CTk):
+    HISTORY_LIMIT = 100
+
     def __init__(self, submit_callback=None):
         super().__init__()
 
@@ -113,10 +117,16 @@ class OverlayApp(ctk.CTk):
         if text and self.submit_callback:
             if not self.history or self.history[-1] != text:
                 self.history.append(text)
+                del self.history[:-self.HISTORY_LIMIT]
             self.history_index = -1
             self.hide_overlay()
             self.submit_callback(text)
 
+    def trim_history(self, keep=20):
+        """Drops older prompts (used when the memory budget is exceeded)."""
+        del self.history[:-keep]
+        self.history_index = -1
+
     def _history_up(self, event=None):
         if not self.history:
             return "break"
@@ -151,16 +161,22 @@ class OverlayApp(ctk.CTk):
             self.after(int(duration * 1000), toast.destroy)
         return toast
 
-    def show_diff(self, original_text, new_text, on_accept_callback):
+    def show_diff(self, original_text, new_text, on_accept_callback, target_window=None):
         """Opens the DiffWindow for human review before pasting."""
-        DiffWindow(self, original_text, new_text, on_accept_callback)
+        DiffWindow(self, original_text, new_text, on_accept_callback, target_window)
 
-    def show_explanation(self, content):
-        """Opens the ExplanationWindow to display AI explanation (read-only)."""
-        ExplanationWindow(self, content)
+    def show_batch_diff(self, original_texts, new_texts, on_accept_callback, target_window=None):
+        """Opens a tabbed review window for a clip stack batch."""
+        BatchDiffWindow(self, original_texts, new_texts, on_accept_callback, target_window)
 
-    def configure_mode(self, mode_name):
-        """Switch the overlay appearance between 'commander' and 'explain' modes."""
+    def show_explanation(self, content, on_follow_up=None):
+        """Opens the ExplanationWindow to display AI explanation (read-only).
+        on_follow_up(question, reply) enables the follow-up question bar."""
+        ExplanationWindow(self, content, on_follow_up)
+
+    def configure_mode(self, mode_name, batch_count=0):
+        """Switch the overlay appearance between 'commander' and 'explain' modes.
+        batch_count > 1 marks a clip stack run in the Commander badge."""
         if mode_name == "explain":
             self.label.configure(text="\u2753 Ask", text_color=_ACCENT_PURPLE)
             self.entry.configure(placeholder_text="What do you want to know about this text?")
@@ -168,19 +184,28 @@ class OverlayApp(ctk.CTk):
         else:
             self.label.configure(text="\u2728 AI", text_color=_ACCENT_BLUE)
             self.entry.configure(placeholder_text="Type a command (e.g., 'Fix grammar', 'Make professional')...")
-            self.mode_badge.configure(text="CMD", fg_color=_ACCENT_BLUE)
+            badge = f"CMD x{batch_count}" if batch_count > 1 else "CMD"
+            self.mode_badge.configure(text=badge, fg_color=_ACCENT_BLUE)
 
 
 # ===========================================================================
 #  DiffWindow - Side-by-side review
 # ===========================================================================
 class DiffWindow(ctk.CTkToplevel):
-    """Human-in-the-loop review window showing original vs AI proposal side-by-side."""
+    """Human-in-the-loop review window showing original vs AI proposal side-by-side.
+
+    Accepting runs as a small state machine so the Tk loop never blocks:
+    review -> waiting_focus -> pasting -> done. The focus wait and the paste
+    (on_accept_callback) run on a worker thread and report back via after().
+    """
 
-    def __init__(self, master, original_text, new_text, on_accept_callback=None):
+    def __init__(self, master, original_text, new_text, on_accept_callback=None, target_window=None,
+                 title="Review Changes"):
         super().__init__(master)
 
         self.on_accept_callback = on_accept_callback
+        self.target_window = target_window
+        self._state = "review"
 
         # --- Window setup ---
         self.overrideredirect(True)
@@ -198,7 +223,7 @@ class DiffWindow(ctk.CTkToplevel):
         header = ctk.CTkFrame(self, height=40, fg_color=_BG_HEADER, corner_radius=0)
         header.grid(row=0, column=0, columnspan=2, sticky="ew", padx=0, pady=0)
         header.grid_propagate(False)
-        title_label = ctk.CTkLabel(header, text="\U0001f50d  Review Changes",
+        title_label = ctk.CTkLabel(header, text=f"\U0001f50d  {title}",
                                    font=_FONT_HEADER, text_color=_TEXT)
         title_label.pack(side="left", padx=16, pady=8)
 
@@ -213,10 +238,39 @@ class DiffWindow(ctk.CTkToplevel):
         self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(1, weight=1)
 
+        # --- Body (row 1) ---
+        self._build_body(original_text, new_text)
+
+        # --- Bottom button bar ---
+        btn_frame = ctk.CTkFrame(self, fg_color="transparent")
+        btn_frame.grid(row=2, column=0, columnspan=2, pady=(0, 12))
+
+        reject_btn = ctk.CTkButton(btn_frame, text="\u2718  Reject (Esc)", width=170, height=36,
+                                   fg_color="#4a2020", hover_color="#6a3030",
+                                   text_color="#ff9090", font=_FONT_BTN,
+                                   corner_radius=8, command=self._reject)
+        reject_btn.pack(side="left", padx=10)
+
+        accept_btn = ctk.CTkButton(btn_frame, text="\u2714  Accept (Enter)", width=170, height=36,
+                                   fg_color="#204a20", hover_color="#306a30",
+                                   text_color="#90ff90", font=_FONT_BTN,
+                                   corner_radius=8, command=self._accept)
+        accept_btn.pack(side="left", padx=10)
+
+        # --- Key bindings ---
+        self.bind("<Return>", lambda e: self._accept())
+        self.bind("<Escape>", lambda e: self._reject())
+        self.after(100, self.focus_force)
+
+    def _build_body(self, original_text, new_text):
+        self.original_box, self.proposal_box = self._build_panels(self, 1, original_text, new_text)
+
+    def _build_panels(self, parent, row, original_text, new_text):
+        """Creates the Original / AI Proposal pair in `parent` and returns both textboxes."""
         # --- Left panel: Original ---
-        left_frame = ctk.CTkFrame(self, fg_color=_BG_DEEP, border_width=2,
+        left_frame = ctk.CTkFrame(parent, fg_color=_BG_DEEP, border_width=2,
                                   border_color=_BORDER_RED, corner_radius=10)
-        left_frame.grid(row=1, column=0, sticky="nsew", padx=(10, 5), pady=10)
+        left_frame.grid(row=row, column=0, sticky="nsew", padx=(10, 5), pady=10)
         left_frame.grid_rowconfigure(1, weight=1)
         left_frame.grid_columnconfigure(0, weight=1)
 
@@ -224,17 +278,17 @@ class DiffWindow(ctk.CTkToplevel):
                                   font=_FONT_HEADER, text_color=_ACCENT_RED)
         left_label.grid(row=0, column=0, padx=14, pady=(10, 4), sticky="w")
 
-        self.original_box = ctk.CTkTextbox(left_frame, fg_color=_BG_CARD, text_color=_TEXT,
+        original_box = ctk.CTkTextbox(left_frame, fg_color=_BG_CARD, text_color=_TEXT,
                                            font=_FONT_BODY, wrap="word", corner_radius=8,
                                            border_width=0, spacing1=5)
-        self.original_box.grid(row=1, column=0, sticky="nsew", padx=10, pady=(0, 10))
-        self.original_box.insert("1.0", original_text)
-        self.original_box.configure(state="disabled")
+        original_box.grid(row=1, column=0, sticky="nsew", padx=10, pady=(0, 10))
+        original_box.insert("1.0", original_text)
+        original_box.configure(state="disabled")
 
         # --- Right panel: AI Proposal (editable) ---
-        right_frame = ctk.CTkFrame(self, fg_color=_BG_DEEP, border_width=2,
+        right_frame = ctk.CTkFrame(parent, fg_color=_BG_DEEP, border_width=2,
                                    border_color=_BORDER_GREEN, corner_radius=10)
-        right_frame.grid(row=1, column=1, sticky="nsew", padx=(5, 10), pady=10)
+        right_frame.grid(row=row, column=1, sticky="nsew", padx=(5, 10), pady=10)
         right_frame.grid_rowconfigure(1, weight=1)
         right_frame.grid_columnconfigure(0, weight=1)
 
@@ -242,32 +296,15 @@ class DiffWindow(ctk.CTkToplevel):
                                    font=_FONT_HEADER, text_color=_ACCENT_GREEN)
         right_label.grid(row=0, column=0, padx=14, pady=(10, 4), sticky="w")
 
-        self.proposal_box = ctk.CTkTextbox(right_frame, fg_color=_BG_CARD, text_color=_TEXT,
+        proposal_box = ctk.CTkTextbox(right_frame, fg_color=_BG_CARD, text_color=_TEXT,
                                            font=_FONT_BODY, wrap="word", corner_radius=8,
                                            border_width=0, spacing1=5)
-        self.proposal_box.grid(row=1, column=0, sticky="nsew", padx=10, pady=(0, 10))
-        self.proposal_box.insert("1.0", new_text)
+        proposal_box.grid(row=1, column=0, sticky="nsew", padx=10, pady=(0, 10))
+        proposal_box.insert("1.0", new_text)
+        return original_box, proposal_box
 
-        # --- Bottom button bar ---
-        btn_frame = ctk.CTkFrame(self, fg_color="transparent")
-        btn_frame.grid(row=2, column=0, columnspan=2, pady=(0, 12))
-
-        reject_btn = ctk.CTkButton(btn_frame, text="\u2718  Reject (Esc)", width=170, height=36,
-                                   fg_color="#4a2020", hover_color="#6a3030",
-                                   text_color="#ff9090", font=_FONT_BTN,
-                                   corner_radius=8, command=self._reject)
-        reject_btn.pack(side="left", padx=10)
-
-        accept_btn = ctk.CTkButton(btn_frame, text="\u2714  Accept (Enter)", width=170, height=36,
-                                   fg_color="#204a20", hover_color="#306a30",
-                                   text_color="#90ff90", font=_FONT_BTN,
-                                   corner_radius=8, command=self._accept)
-        accept_btn.pack(side="left", padx=10)
-
-        # --- Key bindings ---
-        self.bind("<Return>", lambda e: self._accept())
-        self.bind("<Escape>", lambda e: self._reject())
-        self.after(100, self.focus_force)
+    def _collect_result(self):
+        return self.proposal_box.get("1.0", "end-1c")
 
     # --- Drag support ---
     def _start_drag(self, event):
@@ -281,37 +318,92 @@ class DiffWindow(ctk.CTkToplevel):
 
     # --- Actions ---
     def _accept(self):
-        final_text = self.proposal_box.get("1.0", "end-1c")
+        if self._state != "review":
+            return
+        final_text = self._collect_result()
 
         # Hide window and return focus to underlying app
+        self._state = "waiting_focus"
         self.withdraw()
-        self.update_idletasks()
-        time.sleep(0.2)
+        threading.Thread(target=self._accept_worker, args=(final_text,), daemon=True).start()
 
-        if self.on_accept_callback:
-            self.on_accept_callback(final_text)
+    def _accept_worker(self, final_text):
+        # Runs off the Tk thread: paste as soon as the target app has focus again
+        focused = wait_for_focus(self.target_window)
+        logging.debug(f"[Diff] Focus returned: {focused}")
+
+        self._state = "pasting"
+        error = None
+        try:
+            if self.on_accept_callback:
+                self.on_accept_callback(final_text)
+        except Exception as e:
+            error = e
+        self.after(0, lambda: self._on_accept_done(error))
+
+    def _on_accept_done(self, error):
+        self._state = "done"
+        if error:
+            logging.error(f"[Diff] Paste failed: {error}")
+            print(f"[Diff] Paste failed: {error}")
         self.destroy()
 
     def _reject(self):
+        if self._state != "review":
+            return
         self.destroy()
 
 
+# ===========================================================================
+#  BatchDiffWindow - One tab per clip stack snippet
+# ===========================================================================
+class BatchDiffWindow(DiffWindow):
+    """Reviews several Commander results at once; accept passes the list in order."""
+
+    def __init__(self, master, original_texts, new_texts, on_accept_callback=None, target_window=None):
+        super().__init__(master, original_texts, new_texts, on_accept_callback, target_window,
+                         title=f"Review {len(new_texts)} Changes")
+
+    def _build_body(self, original_texts, new_texts):
+        tabview = ctk.CTkTabview(self, fg_color=_BG_DEEP, corner_radius=10)
+        tabview.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=10, pady=(0, 4))
+
+        self.proposal_boxes = []
+        for i, (original, proposal) in enumerate(zip(original_texts, new_texts)):
+            tab = tabview.add(f"Snippet {i + 1}")
+            tab.grid_columnconfigure(0, weight=1)
+            tab.grid_columnconfigure(1, weight=1)
+            tab.grid_rowconfigure(0, weight=1)
+            _, proposal_box = self._build_panels(tab, 0, original, proposal)
+            self.proposal_boxes.append(proposal_box)
+
+    def _collect_result(self):
+        return [box.get("1.0", "end-1c") for box in self.proposal_boxes]
+
+
 # ===========================================================================
 #  ExplanationWindow - Read-only AI insight
 # ===========================================================================
 class ExplanationWindow(ctk.CTkToplevel):
-    """Read-only card window displaying the AI's explanation."""
+    """Read-only card window displaying the AI's explanation.
 
-    def __init__(self, master, content):
+    With on_follow_up, a question bar lets the user ask more about the same
+    selection. on_follow_up(question, reply) must not block; it calls
+    reply(answer) on the Tk thread once the answer is ready.
+    """
+
+    def __init__(self, master, content, on_follow_up=None):
         super().__init__(master)
         self._content = content
+        self.on_follow_up = on_follow_up
+        self._waiting = False
 
         # --- Window setup ---
         self.overrideredirect(True)
         self.attributes('-topmost', True)
         self.configure(fg_color=_BG_DEEP)
 
-        width, height = 660, 440
+        width, height = 660, 490 if on_follow_up else 440
         screen_w = self.winfo_screenwidth()
         screen_h = self.winfo_screenheight()
         x = (screen_w // 2) - (width // 2)
@@ -350,9 +442,27 @@ class ExplanationWindow(ctk.CTkToplevel):
         self.text_box.insert("1.0", content)
         self.text_box.configure(state="disabled")
 
+        # --- Follow-up question bar ---
+        if on_follow_up:
+            ask_frame = ctk.CTkFrame(self, fg_color=_BG_INPUT, corner_radius=10)
+            ask_frame.grid(row=2, column=0, sticky="ew", padx=10, pady=(0, 10))
+            ask_frame.grid_columnconfigure(0, weight=1)
+
+            self.ask_entry = ctk.CTkEntry(ask_frame, placeholder_text="Ask a follow-up question...",
+                                          border_width=0, fg_color="transparent",
+                                          text_color=_TEXT, font=_FONT_BODY)
+            self.ask_entry.grid(row=0, column=0, sticky="ew", padx=10, pady=6)
+            self.ask_entry.bind("<Return>", self._ask)
+
+            self.ask_btn = ctk.CTkButton(ask_frame, text="Ask", width=70, height=30,
+                                         fg_color=_ACCENT_PURPLE, hover_color="#7d36cc",
+                                         text_color="#ffffff", font=_FONT_BTN,
+                                         corner_radius=8, command=self._ask)
+            self.ask_btn.grid(row=0, column=1, padx=(0, 8), pady=6)
+
         # --- Footer buttons ---
         btn_frame = ctk.CTkFrame(self, fg_color="transparent")
-        btn_frame.grid(row=2, column=0, pady=(0, 12))
+        btn_frame.grid(row=3, column=0, pady=(0, 12))
 
         copy_btn = ctk.CTkButton(btn_frame, text="\U0001f4cb  Copy", width=140, height=36,
                                  fg_color=_ACCENT_BLUE, hover_color="#2d7abc",
@@ -370,6 +480,31 @@ class ExplanationWindow(ctk.CTkToplevel):
         self.bind("<Escape>", lambda e: self.destroy())
         self.after(100, self.focus_force)
 
+    # --- Follow-up ---
+    def _ask(self, event=None):
+        question = self.ask_entry.get().strip()
+        if not question or self._waiting:
+            return
+        self._waiting = True
+        self.ask_entry.delete(0, "end")
+        self.ask_btn.configure(state="disabled", text="...")
+        self._append(f"\n\n\u2753 {question}\n")
+        self.on_follow_up(question, self._on_follow_up_answer)
+
+    def _on_follow_up_answer(self, answer):
+        if not self.winfo_exists():
+            return
+        self._waiting = False
+        self.ask_btn.configure(state="normal", text="Ask")
+        self._append(f"\n{answer}")
+
+    def _append(self, text):
+        self._content += text
+        self.text_box.configure(state="normal")
+        self.text_box.insert("end", text)
+        self.text_box.configure(state="disabled")
+        self.text_box.see("end")
+
     # --- Copy ---
     def _copy(self):
         try:
@@ -0,0 +1,94 @@
+import os
+import time
+import queue
+import logging
+import threading
+import traceback
+
+
+class HotkeyDispatcher:
+    """
+    Decouples global hotkey callbacks from the work they trigger.
+
+    The keyboard hook only calls trigger(), which records the event and returns
+    immediately. A single worker thread runs the registered handlers (clipboard
+    capture etc.) one at a time, so captures never overlap. Repeats of the same
+    hotkey inside the debounce window (key auto-repeat, double presses) are
+    dropped, and a trigger for a hotkey that is already queued or running is
+    coalesced into that one. Dropped events are only counted on the hook
+    thread; the worker logs the counts.
+    """
+
+    def __init__(self, debounce=None):
+        if debounce is None:
+            debounce = int(os.getenv("CTRL_AI_HOTKEY_DEBOUNCE_MS", "300")) / 1000.0
+        self.debounce = debounce
+        self._handlers = {}
+        self._last_trigger = {}
+        self._busy = set()  # Names queued or currently running
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._dropped = {}  # (name, reason) -> count not yet logged
+        self.debounced = 0
+        self.coalesced = 0
+
+    def register(self, name, handler):
+        self._handlers[name] = handler
+
+    def callback(self, name):
+        """Returns a zero-argument function suitable for a hotkey backend."""
+        return lambda: self.trigger(name)
+
+    def start(self):
+        if self._worker and self._worker.is_alive():
+            return
+        self._worker = threading.Thread(target=self._run, name="HotkeyWorker", daemon=True)
+        self._worker.start()
+
+    def trigger(self, name):
+        """Called from the hook thread. Must never block."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_trigger.get(name, 0.0)
+            self._last_trigger[name] = now
+            if now - last < self.debounce:
+                self.debounced += 1
+                self._drop(name, "debounced")
+                return False
+            if name in self._busy:
+                self.coalesced += 1
+                self._drop(name, "coalesced")
+                return False
+            self._busy.add(name)
+        self._queue.put_nowait((name, now))
+        return True
+
+    def _drop(self, name, reason):
+        # Caller holds self._lock
+        key = (name, reason)
+        self._dropped[key] = self._dropped.get(key, 0) + 1
+
+    def _log_dropped(self):
+        with self._lock:
+            dropped, self._dropped = self._dropped, {}
+        for (name, reason), count in dropped.items():
+            logging.debug(f"[Hotkey] '{name}' {reason} x{count}")
+
+    def _run(self):
+        while True:
+            name, queued_at = self._queue.get()
+            handler = self._handlers.get(name)
+            self._log_dropped()
+            try:
+                if handler:
+                    wait_ms = (time.monotonic() - queued_at) * 1000
+                    logging.debug(f"[Hotkey] Running '{name}' (queued {wait_ms:.0f} ms)")
+                    handler()
+            except Exception as e:
+                logging.error(f"[Hotkey] Handler '{name}' failed: {e}")
+                logging.error(traceback.format_exc())
+            finally:
+                with self._lock:
+                    self._busy.discard(name)
+                self._log_dropped()
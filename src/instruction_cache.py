@@ -0,0 +1,172 @@
+import os
+import re
+import math
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Optional: NumPy speeds up the brute-force similarity search
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+VECTOR_DIM = 512
+
+# Filler words that don't change what an instruction asks for
+_STOPWORDS = {
+    "a", "an", "the", "this", "that", "these", "my", "it", "its", "please", "pls",
+    "can", "could", "you", "would", "kindly", "just", "text", "of", "in", "for",
+    "up", "me", "some", "any", "to", "into",
+}
+# Cheap suffix folding so "fixing"/"fixed"/"fixes" and "fix" line up
+_SUFFIXES = ("ing", "ed", "es", "s")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# British/American spellings: the only way two differing words may still match
+_SPELLING_RE = re.compile(r"(?<=[a-z]{3})([iy])s(e|ation)?$")
+_SPELLING_VARIANTS = {
+    "regexp": "regex", "colour": "color", "behaviour": "behavior", "favour": "favor",
+    "centre": "center", "catalogue": "catalog", "dialogue": "dialog", "licence": "license",
+}
+
+def normalize_instruction(instruction):
+    """
+    Lowercases, drops filler words and folds simple suffixes, so "Fix the
+    grammar" and "fixing grammar" normalize the same. Word order is kept:
+    "translate english to french" and "translate french to english" differ.
+    """
+    tokens = []
+    for word in _WORD_RE.findall((instruction or "").lower()):
+        if word in _STOPWORDS:
+            continue
+        for suffix in _SUFFIXES:
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        tokens.append(word)
+    return " ".join(tokens)
+
+
+def _ngram_counts(normalized):
+    """Hashed character trigram counts of each token (with boundary markers)."""
+    counts = {}
+    for token in normalized.split():
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            bucket = zlib.crc32(padded[i:i + 3].encode("utf-8")) % VECTOR_DIM
+            counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+def _spelling(token):
+    token = _SPELLING_VARIANTS.get(token, token)
+    return _SPELLING_RE.sub(r"\1z\2", token)
+
+
+def _tokens_compatible(a, b):
+    """
+    Guards the vector match, which ignores word order and scores words that
+    merely look alike ("spanish"/"danish", "serialize"/"deserialize") as
+    close. Both instructions must have the same words, up to spelling
+    variants ("summarise"/"summarize", "regexp"/"regex"), in the same order.
+    Two-word instructions may be swapped ("grammar fix" vs "fix grammar"):
+    without a third word there is no direction to reverse, unlike "replace
+    foo with bar" vs "replace bar with foo".
+    """
+    ta = [_spelling(t) for t in a.split()]
+    tb = [_spelling(t) for t in b.split()]
+    if ta == tb:
+        return True
+    return len(ta) <= 2 and sorted(ta) == sorted(tb)
+
+def _vectorize(normalized):
+    counts = _ngram_counts(normalized)
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    if np is not None:
+        vec = np.zeros(VECTOR_DIM, dtype=np.float32)
+        for bucket, value in counts.items():
+            vec[bucket] = value / norm
+        return vec
+    return {bucket: value / norm for bucket, value in counts.items()}
+
+
+def _cosine(a, b):
+    if np is not None:
+        return float(np.dot(a, b))
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(bucket, 0.0) for bucket, value in a.items())
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class InstructionCache:
+    """
+    Two-tier result cache in front of AIHandler.process_text.
+
+    Tier 1: exact match on (selected text, mode, normalized instruction).
+    Tier 2: same selected text and mode, instruction matched by cosine
+    similarity of hashed character-trigram vectors above `threshold`.
+    The selected text must always match exactly; only its hash is kept.
+    """
+
+    def __init__(self, max_entries=None, threshold=None):
+        self.max_entries = max_entries or int(os.getenv("CTRL_AI_CACHE_SIZE", "256"))
+        self.threshold = threshold or float(os.getenv("CTRL_AI_CACHE_THRESHOLD", "0.65"))
+        self._lock = threading.Lock()
+        # (text_hash, mode, normalized) -> (vector, result); ordered for LRU eviction
+        self._entries = OrderedDict()
+        self.hits = {"exact": 0, "semantic": 0, "miss": 0}
+
+    def get(self, text, mode, instruction):
+        """Returns (result, outcome) where outcome is 'exact', 'semantic' or 'miss'."""
+        digest = text_hash(text)
+        normalized = normalize_instruction(instruction)
+        key = (digest, mode, normalized)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits["exact"] += 1
+                return entry[1], "exact"
+
+            candidates = [(k, v) for k, v in self._entries.items() if k[0] == digest and k[1] == mode]
+            if candidates and normalized:
+                query = _vectorize(normalized)
+                if np is not None:
+                    matrix = np.stack([v[0] for _, v in candidates])
+                    scores = matrix @ query
+                    best = int(np.argmax(scores))
+                    best_score = float(scores[best])
+                else:
+                    scores = [_cosine(query, v[0]) for _, v in candidates]
+                    best = max(range(len(scores)), key=scores.__getitem__)
+                    best_score = scores[best]
+                best_key, (_, result) = candidates[best]
+                if best_score >= self.threshold and _tokens_compatible(normalized, best_key[2]):
+                    self._entries.move_to_end(best_key)
+                    self.hits["semantic"] += 1
+                    return result, "semantic"
+
+            self.hits["miss"] += 1
+            return None, "miss"
+
+    def put(self, text, mode, instruction, result):
+        normalized = normalize_instruction(instruction)
+        key = (text_hash(text), mode, normalized)
+        vector = _vectorize(normalized)
+        with self._lock:
+            self._entries[key] = (vector, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
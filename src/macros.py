@@ -0,0 +1,72 @@
+import logging
+from app_config import load_json
+from router import split_override
+
+MACROS_FILE = "macros.json"
+
+# Hotkeys that already belong to the built-in actions
+RESERVED_HOTKEYS = {"ctrl+space", "ctrl+alt+e", "ctrl+shift+space"}
+
+
+class Macro:
+    """
+    A one-shot Commander instruction bound to its own hotkey.
+    hotkey: 'keyboard' library format, e.g. "ctrl+alt+g".
+    instruction: the prompt, optionally with an "@provider:model" prefix.
+    """
+
+    def __init__(self, hotkey, instruction, warm=True, providers=()):
+        self.hotkey = normalize_hotkey(hotkey)
+        self.route, self.instruction = split_override(instruction.strip(), providers)
+        self.warm = warm
+
+    @property
+    def name(self):
+        return f"macro:{self.hotkey}"
+
+    @property
+    def pynput_hotkey(self):
+        return to_pynput_hotkey(self.hotkey)
+
+    def __repr__(self):
+        return f"Macro({self.hotkey!r}, {self.instruction!r})"
+
+
+def normalize_hotkey(hotkey):
+    return "+".join(part.strip().lower() for part in hotkey.split("+"))
+
+
+def to_pynput_hotkey(hotkey):
+    """'ctrl+alt+g' -> '<ctrl>+<alt>+g' (named keys need angle brackets in pynput)."""
+    return "+".join(part if len(part) == 1 else f"<{part}>" for part in hotkey.split("+"))
+
+
+def load_macros(providers=()):
+    """
+    Reads macros.json from app_dir():
+        {"macros": [{"hotkey": "ctrl+alt+g", "instruction": "Fix grammar"}, ...]}
+    Invalid, duplicate or reserved hotkeys are skipped with a warning.
+    providers: registered provider names, for "@provider:model" prefixes.
+    """
+    config = load_json(MACROS_FILE, default=None)
+    if not config:
+        return []
+
+    macros, seen = [], set(RESERVED_HOTKEYS)
+    for entry in config.get("macros", []):
+        try:
+            macro = Macro(entry["hotkey"], entry["instruction"],
+                          warm=entry.get("warm", True), providers=providers)
+        except (KeyError, TypeError, AttributeError) as e:
+            logging.warning(f"[Macros] Skipping invalid entry {entry!r}: {e}")
+            continue
+        if not macro.instruction:
+            logging.warning(f"[Macros] Skipping {macro.hotkey}: empty instruction")
+            continue
+        if macro.hotkey in seen:
+            logging.warning(f"[Macros] Skipping {macro.hotkey}: hotkey already in use")
+            continue
+        seen.add(macro.hotkey)
+        macros.append(macro)
+    logging.info(f"[Macros] Loaded {len(macros)} macros.")
+    return macros
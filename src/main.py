@@ -1,17 +1,13 @@
-print("Main starting...")
 import logging
 import ctypes
 import os
 import platform
 import traceback
-logging.basicConfig(filename='debug.log', level=logging.DEBUG, format='%(asctime)s %(message)s')
-logging.info("Main script starting...")
-
 import sys
 import time
 import threading
-import pystray
-from PIL import Image, ImageDraw
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 
 def resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller bundle."""
@@ -21,29 +17,59 @@ def resource_path(relative_path):
     # Running from source: go up one level from src/
     return os.path.join(os.path.dirname(os.path.dirname(__file__)), relative_path)
 
-try:
-    import keyboard as keyboard_lib # Use updated name to avoid conflict with pynput variable if mixed
-except ImportError:
-    keyboard_lib = None
-
-# Fallback for non-linux systems or if keyboard lib fails
-try:
-    from pynput import keyboard as pynput_keyboard
-except ImportError:
-    pynput_keyboard = None
-
-from clipboard_utils import capture_selection, paste_text
-from ai_handler import AIHandler
-
-# Try importing GUI; gracefully handle if tkinter is missing (e.g. on headless/some Linux)
-try:
-    from gui import OverlayApp
-    GUI_AVAILABLE = True
-except ImportError as e:
-    logging.error(f"GUI Import failed: {e}")
-    print(f"WARNING: GUI not available ({e}). Commander mode will be disabled.")
-    GUI_AVAILABLE = False
-    OverlayApp = None
+# Everything below is only loaded by the app itself. The AI worker is started
+# with "spawn", which re-runs this file as __mp_main__: it must not import the
+# tray, hotkey hooks, clipboard controller or Tk, nor claim the log config.
+if __name__ == "__main__":
+    # The AI worker process re-enters here in the frozen .exe
+    multiprocessing.freeze_support()
+
+    print("Main starting...")
+    logging.basicConfig(filename='debug.log', level=logging.DEBUG, format='%(asctime)s %(message)s')
+    logging.info("Main script starting...")
+
+    # Relaunch: hand the command to the running daemon before loading the GUI, hotkeys or SDKs
+    from single_instance import hand_off
+    if hand_off(sys.argv[1:]):
+        sys.exit(0)
+
+    import pystray
+    from PIL import Image, ImageDraw
+
+    try:
+        import keyboard as keyboard_lib # Use updated name to avoid conflict with pynput variable if mixed
+    except ImportError:
+        keyboard_lib = None
+
+    # Fallback for non-linux systems or if keyboard lib fails
+    try:
+        from pynput import keyboard as pynput_keyboard
+    except ImportError:
+        pynput_keyboard = None
+
+    from clipboard_utils import capture_selection, get_foreground_window
+    from paste_backends import paste
+    from dotenv import load_dotenv
+    from hotkey_dispatcher import HotkeyDispatcher
+    from router import split_override
+    from memory_monitor import MemoryMonitor
+    from profiler import SamplingProfiler
+    from ui_watchdog import UIWatchdog
+    from macros import load_macros
+    from single_instance import InstanceServer
+
+    # .env is read here too: CTRL_AI_WORKER_PROCESS decides whether ai_handler is imported at all
+    load_dotenv()
+
+    # Try importing GUI; gracefully handle if tkinter is missing (e.g. on headless/some Linux)
+    try:
+        from gui import OverlayApp
+        GUI_AVAILABLE = True
+    except ImportError as e:
+        logging.error(f"GUI Import failed: {e}")
+        print(f"WARNING: GUI not available ({e}). Commander mode will be disabled.")
+        GUI_AVAILABLE = False
+        OverlayApp = None
 
 def create_icon():
     # Try to load custom icon
@@ -78,12 +104,48 @@ class CtrlAIApp:
         logging.info("Initializing App")
         self.running = True
         self.listener = None
-        self.ai = AIHandler()
+        self.icon = None
+        self.instance = None  # single_instance.InstanceServer, set by __main__
+        if os.getenv("CTRL_AI_WORKER_PROCESS", "0") == "1":
+            # AI SDKs live in a separate process; this one only runs UI and hotkeys
+            from ai_worker import AIWorkerClient
+            self.ai = AIWorkerClient()
+        else:
+            from ai_handler import AIHandler
+            self.ai = AIHandler()
         self.gui = None
         self.captured_text_for_commander = ""
+        self.target_window = None  # Window the open overlay's selection came from
+        self.clip_stack = []  # Snippets collected with Ctrl+Shift+Space
+        self.commander_batch = []  # Snapshot of the stack for the pending instruction
+        self.pending_pastes = []  # Accepted batch results, pasted one per Ctrl+Space
+        self.pending_total = 0
         self.current_mode = "commander"
         self.active_toast = None
 
+        # Hotkey callbacks only enqueue; capture runs on the dispatcher's worker
+        self.dispatcher = HotkeyDispatcher()
+        self.dispatcher.register("commander", self.on_commander)
+        self.dispatcher.register("explain", self.on_explain)
+        self.dispatcher.register("stack", self.on_stack)
+
+        # One-shot instruction macros from macros.json (own hotkeys, no overlay)
+        self.macros = load_macros(self.ai.provider_names())
+        for macro in self.macros:
+            self.dispatcher.register(macro.name, lambda m=macro: self.on_macro(m))
+
+        # RSS budget + tracemalloc reports for the long-running daemon
+        self.memory = MemoryMonitor()
+        self.memory.register_evictor("ai", self.ai.release_memory)
+        self.memory.register_evictor("payloads", self.drop_payloads)
+
+        # On-demand sampling profiler (tray menu)
+        self.profiler = SamplingProfiler()
+        self.profile_requests_left = 0
+
+        # Tk main-loop stall detector, started with the GUI (CTRL_AI_UI_WATCHDOG=0 disables)
+        self.watchdog = None
+
         if GUI_AVAILABLE:
             self.gui = OverlayApp(submit_callback=self.on_commander_submit)
             
@@ -101,17 +163,118 @@ class CtrlAIApp:
 
     def stop_app(self, icon, item):
         logging.info("Stopping app from tray...")
-        icon.stop()
+        if icon:
+            icon.stop()
         if self.gui:
             self.gui.quit()
+        if hasattr(self.ai, "close"):
+            self.ai.close()
+        if self.instance:
+            self.instance.release()
         os._exit(0)
 
+    def instance_commands(self):
+        """Commands a relaunched main.py / Ctrl-AI.exe can send (see single_instance)."""
+        return {
+            "show": self.show_overlay,
+            "reload": self.reload_config,
+            # Reply to the launcher first, then exit
+            "quit": lambda: threading.Timer(0.1, self.stop_app, args=(self.icon, None)).start(),
+        }
+
+    def show_overlay(self):
+        """Brings up the Commander overlay without capturing a selection (launcher --show)."""
+        if not self.gui:
+            raise RuntimeError("no GUI to show")
+        self.gui.after(0, self._show_empty_overlay)
+
+    def _show_empty_overlay(self):
+        # Nothing was captured: forget any selection/target left by an overlay closed with Escape
+        self.current_mode = "commander"
+        self.commander_batch = []
+        self._show_overlay_for_mode("commander", text="")
+
+    def reload_config(self, icon=None, item=None):
+        """Re-reads routing.json and macros.json without restarting."""
+        self.ai.reload_config()
+        reloaded = {m.hotkey: m for m in load_macros(self.ai.provider_names())}
+        for macro in self.macros:
+            new = reloaded.pop(macro.hotkey, None)
+            if new:
+                macro.instruction, macro.route, macro.warm = new.instruction, new.route, new.warm
+        if reloaded:
+            print(f"[Macros] New hotkeys need a restart: {', '.join(reloaded)}")
+        print("[Config] Reloaded.")
+
     def run_tray_icon(self):
-        icon = pystray.Icon("Ctrl-AI", create_icon(), menu=pystray.Menu(
+        self.icon = icon = pystray.Icon("Ctrl-AI", create_icon(), menu=pystray.Menu(
+            pystray.MenuItem("Clear Clip Stack", self.clear_clip_stack),
+            pystray.MenuItem("Profile for 30 s", self.profile_for_30s),
+            pystray.MenuItem("Profile Next 5 Requests", self.profile_next_requests),
+            pystray.MenuItem("Memory Snapshot", self.memory_snapshot),
+            pystray.MenuItem("UI Stall Report", self.ui_stall_report),
+            pystray.MenuItem("Free Memory", self.free_memory),
+            pystray.MenuItem("Reload Config", self.reload_config),
             pystray.MenuItem("Quit", self.stop_app)
         ))
         icon.run()
 
+    def memory_snapshot(self, icon=None, item=None):
+        path = self.memory.take_snapshot()
+        print(f"[Memory] Report: {path}")
+
+    def free_memory(self, icon=None, item=None):
+        freed = self.memory.enforce_budget()
+        print(f"[Memory] Freed {freed / 2**20:.1f} MB")
+
+    def ui_stall_report(self, icon=None, item=None):
+        """UI stall report plus the AI side's rate-limit queue waits."""
+        lines = [self.watchdog.report() if self.watchdog else "[UI] Watchdog not running."]
+        limits = self.ai.rate_limit_stats()
+        if limits:
+            lines.append("Rate-limit queue (per provider):")
+            for name, stats in sorted(limits.items()):
+                lines.append(f"  {name:>8}: {stats['waits']} waits, avg {stats['avg_wait_ms']:.0f} ms, "
+                             f"max {stats['max_wait_ms']:.0f} ms, {stats['throttled']} x 429, "
+                             f"{stats['queued']} queued now")
+        report = "\n".join(lines)
+        logging.info(report)
+        print(report)
+
+    def profile_for_30s(self, icon=None, item=None):
+        if self.profiler.start(duration=30):
+            print("[Profiler] Sampling for 30 s...")
+        else:
+            print("[Profiler] Already running.")
+
+    def profile_next_requests(self, icon=None, item=None, count=5):
+        if self.profiler.start():
+            self.profile_requests_left = count
+            print(f"[Profiler] Sampling the next {count} requests...")
+        else:
+            print("[Profiler] Already running.")
+
+    def _request_finished(self):
+        """Stops a 'next N requests' profile once the last one completes."""
+        if self.profile_requests_left > 0:
+            self.profile_requests_left -= 1
+            if self.profile_requests_left == 0:
+                folded, prof = self.profiler.stop()
+                print(f"[Profiler] Written: {folded}, {prof}")
+
+    def drop_payloads(self):
+        """Releases retained selections and trims prompt history (monitor thread)."""
+        if self.gui:
+            self.gui.after(0, self._drop_payloads_on_ui)
+        else:
+            self.captured_text_for_commander = ""
+
+    def _drop_payloads_on_ui(self):
+        # An open overlay still needs its selection; pending requests hold their own copy
+        if self.gui.state() == "withdrawn":
+            self.captured_text_for_commander = ""
+        self.gui.trim_history()
+
     def show_progress(self, message):
         if self.gui:
             self.gui.after(0, lambda: self._gui_show_toast(message))
@@ -144,37 +307,148 @@ class CtrlAIApp:
             print("Commander mode requires GUI (tkinter missing).")
             return
 
-        # 1. Capture text first (The "Context")
+        # An accepted batch is being placed: this press pastes the next result
+        if self.pending_pastes:
+            self._paste_next_batch_result()
+            return
+
+        # 1. Capture text first (The "Context"), with the window it came from
+        target = get_foreground_window()
         text = capture_selection()
+
+        # Clip stack: the current selection joins the stacked snippets
+        if self.clip_stack:
+            if text and text != self.clip_stack[-1]:
+                self.clip_stack.append(text)
+            self.commander_batch = self.clip_stack
+            self.clip_stack = []
+            count = len(self.commander_batch)
+            print(f"[Commander] Batch of {count} snippets.")
+            self.current_mode = "commander"
+            self.gui.after(0, lambda: self._show_overlay_for_mode("commander", count, target=target))
+            return
+
+        self.commander_batch = []
         if text:
             print(f"[Commander] Context captured: '{text[:20]}...'")
-            self.captured_text_for_commander = text
             self.current_mode = "commander"
-            self.gui.after(0, lambda: self._show_overlay_for_mode("commander"))
+            self.gui.after(0, lambda: self._show_overlay_for_mode("commander", text=text, target=target))
         else:
             print("[Commander] No text selected.")
 
-    def _show_overlay_for_mode(self, mode):
-        self.gui.configure_mode(mode)
+    def _show_overlay_for_mode(self, mode, batch_count=0, text=None, target=None):
+        # The selection is only stored and taken on the Tk thread (see drop_payloads)
+        if text is not None:
+            self.captured_text_for_commander = text
+        self.target_window = target
+        self.gui.configure_mode(mode, batch_count)
         self.gui.show_overlay()
 
+    def on_stack(self):
+        logging.info("[Stack] Triggered (Ctrl+Shift+Space)")
+        print("[Stack] Triggered (Ctrl+Shift+Space)")
+
+        text = capture_selection()
+        if not text:
+            print("[Stack] No text selected.")
+            return
+        self.clip_stack.append(text)
+        print(f"[Stack] {len(self.clip_stack)} snippets stacked.")
+        self.show_progress(f"Stacked {len(self.clip_stack)} snippet(s) - Ctrl+Space to run")
+        threading.Timer(1.0, self.hide_progress).start()
+
+    def clear_clip_stack(self, icon=None, item=None):
+        self.clip_stack = []
+        self.commander_batch = []
+        if self.pending_pastes:
+            self.pending_pastes = []
+            self.hide_progress()
+        print("[Stack] Cleared.")
+
     def on_commander_submit(self, prompt):
         print(f"[{self.current_mode.capitalize()}] Prompt: {prompt}")
+        # Optional per-request model override, e.g. "@groq:llama-3.1-8b-instant fix grammar"
+        route, prompt = split_override(prompt, self.ai.provider_names())
+        # Take the selection now, on the Tk thread, so drop_payloads can't race the worker
+        original, self.captured_text_for_commander = self.captured_text_for_commander, ""
+        target, self.target_window = self.target_window, None
+        if not original and not (self.current_mode == "commander" and self.commander_batch):
+            print(f"[{self.current_mode.capitalize()}] No text selected; nothing to run.")
+            self._gui_show_toast("No text selected")
+            self.gui.after(1500, self._gui_hide_toast)
+            return
         if self.current_mode == "explain":
-            threading.Thread(target=self.process_explain, args=(prompt,)).start()
+            threading.Thread(target=self.process_explain, args=(prompt, route, original)).start()
+        elif self.commander_batch:
+            batch = self.commander_batch
+            self.commander_batch = []
+            threading.Thread(target=self.process_commander_batch, args=(prompt, batch, route, target)).start()
         else:
-            threading.Thread(target=self.process_commander, args=(prompt,)).start()
+            threading.Thread(target=self.process_commander, args=(prompt, route, original, target)).start()
 
-    def process_commander(self, prompt):
+    def process_commander(self, prompt, route=None, original=None, target_window=None):
         logging.info(f"Processing Commander: {prompt}")
         self.show_progress(f"Commander: {prompt}...")
         try:
-            original = self.captured_text_for_commander
-            result = self.ai.process_text(original, mode="commander", prompt_instruction=prompt)
+            if original is None:
+                original = self.captured_text_for_commander
+                self.captured_text_for_commander = ""  # Don't retain the selection after use
+            result = self.ai.process_text(original, mode="commander", prompt_instruction=prompt, route=route)
             logging.info("Commander done.")
-            self._show_diff_or_paste(original, result)
+            self._show_diff_or_paste(original, result, target_window)
         finally:
             self.hide_progress()
+            self._request_finished()
+
+    def process_commander_batch(self, prompt, snippets, route=None, target_window=None):
+        """Runs one instruction over all stacked snippets concurrently."""
+        logging.info(f"Processing Commander batch ({len(snippets)}): {prompt}")
+        self.show_progress(f"Commander x{len(snippets)}: {prompt}...")
+        try:
+            def run(snippet):
+                return self.ai.process_text(snippet, mode="commander", prompt_instruction=prompt, route=route)
+
+            max_workers = min(len(snippets), int(os.getenv("CTRL_AI_MAX_PARALLEL", "4")))
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(run, snippets))  # Keeps snippet order
+            logging.info("Commander batch done.")
+            self._show_batch_diff_or_paste(snippets, results, target_window)
+        finally:
+            self.hide_progress()
+            self._request_finished()
+
+    def on_macro(self, macro):
+        """
+        Captures the selection and runs the macro's instruction without the
+        overlay. The result still goes through the diff window.
+        """
+        logging.info(f"[Macro] Triggered ({macro.hotkey}): {macro.instruction}")
+        print(f"[Macro] {macro.hotkey}: {macro.instruction}")
+
+        if not self.gui:
+            print("Macros require GUI (tkinter missing).")
+            return
+
+        target = get_foreground_window()
+        text = capture_selection()
+
+        if self.clip_stack:
+            if text and text != self.clip_stack[-1]:
+                self.clip_stack.append(text)
+            batch, self.clip_stack = self.clip_stack, []
+            threading.Thread(target=self.process_commander_batch,
+                             args=(macro.instruction, batch, macro.route, target)).start()
+        elif text:
+            threading.Thread(target=self.process_commander,
+                             args=(macro.instruction, macro.route, text, target)).start()
+        else:
+            print("[Macro] No text selected.")
+
+    def warm_macros(self):
+        """Pre-warms providers (e.g. loads the local model) for macro instructions."""
+        for macro in self.macros:
+            if macro.warm:
+                self.ai.warm(macro.instruction, macro.route)
 
     def on_refactor(self):
         pass  # REMOVED in v2.0
@@ -199,38 +473,90 @@ class CtrlAIApp:
             return
 
         print(f"[Explain] Context captured: '{text[:20]}...'")
-        self.captured_text_for_commander = text
         self.current_mode = "explain"
-        self.gui.after(0, lambda: self._show_overlay_for_mode("explain"))
+        self.gui.after(0, lambda: self._show_overlay_for_mode("explain", text=text))
 
-    def process_explain(self, user_question):
+    def process_explain(self, user_question, route=None, original=None):
         logging.info(f"[Explain] Question: {user_question}")
         print(f"[Explain] Question: {user_question}")
         self.show_progress("Explaining...")
         
         try:
-            original = self.captured_text_for_commander
-            result = self.ai.process_text(original, mode="explain", prompt_instruction=user_question)
+            if original is None:
+                original = self.captured_text_for_commander
+                self.captured_text_for_commander = ""
+            result = self.ai.process_text(original, mode="explain", prompt_instruction=user_question,
+                                          route=route)
             logging.info("[Explain] Showing explanation...")
             print("[Explain] Showing explanation...")
             if self.gui:
-                self.gui.after(0, lambda: self.gui.show_explanation(result))
+                on_follow_up = self._make_follow_up_handler(original)
+                self.gui.after(0, lambda: self.gui.show_explanation(result, on_follow_up))
             logging.info("[Explain] Done.")
         finally:
             self.hide_progress()
+            self._request_finished()
 
-    def _show_diff_or_paste(self, original, result):
+    def _make_follow_up_handler(self, text):
+        """Binds follow-up questions from the ExplanationWindow to this selection."""
+        def on_follow_up(question, reply):
+            def work():
+                logging.info(f"[Explain] Follow-up: {question}")
+                try:
+                    answer = self.ai.explain_follow_up(text, question)
+                except Exception as e:
+                    answer = f"[Error] {e}"
+                self.gui.after(0, lambda: reply(answer))
+            threading.Thread(target=work, daemon=True).start()
+        return on_follow_up
+
+    def _show_diff_or_paste(self, original, result, target_window=None):
         """Show the diff window for review. Paste only if user accepts."""
         def on_accept(final_text):
+            # Called on the DiffWindow's worker thread once focus is back
             logging.info("[Diff] User accepted. Pasting...")
             print("[Diff] User accepted. Pasting...")
-            paste_text(final_text)
+            paste(final_text, target_window)
 
         if self.gui:
-            self.gui.after(0, lambda: self.gui.show_diff(original, result, on_accept))
+            self.gui.after(0, lambda: self.gui.show_diff(original, result, on_accept, target_window))
         else:
             # No GUI available — fall back to auto-paste
-            paste_text(result)
+            paste(result, target_window)
+
+    def _show_batch_diff_or_paste(self, originals, results, target_window=None):
+        """
+        Review all batch results at once. The snippets are scattered over the
+        document, so accepted results are not pasted in one go: the user
+        selects each snippet in turn and Ctrl+Space replaces it with its result.
+        """
+        def on_accept(final_texts):
+            logging.info(f"[Diff] User accepted batch of {len(final_texts)}.")
+            print(f"[Diff] User accepted batch of {len(final_texts)}.")
+            self.pending_total = len(final_texts)
+            self.pending_pastes = list(final_texts)
+            self._prompt_batch_paste()
+
+        if self.gui:
+            self.gui.after(0, lambda: self.gui.show_batch_diff(originals, results, on_accept, target_window))
+        else:
+            on_accept(results)
+
+    def _prompt_batch_paste(self):
+        step = self.pending_total - len(self.pending_pastes) + 1
+        message = f"Select snippet {step}/{self.pending_total} and press Ctrl+Space to paste its result"
+        print(f"[Stack] {message} (tray: Clear Clip Stack to stop).")
+        self.show_progress(message)
+
+    def _paste_next_batch_result(self):
+        """Pastes the next accepted batch result over the current selection (hotkey worker)."""
+        text = self.pending_pastes.pop(0)
+        paste(text, get_foreground_window())
+        if self.pending_pastes:
+            self._prompt_batch_paste()
+        else:
+            self.hide_progress()
+            print("[Stack] All batch results pasted.")
 
     def start_listener(self):
         # Determine backend based on OS
@@ -243,16 +569,25 @@ class CtrlAIApp:
             
             # keyboard library format
             try:
-                # Debug hook to see what keys are detected (helps diagnose mapping issues)
-                def debug_key_hook(event):
-                    logging.debug(f"KEY_EVENT: {event.name} ({event.event_type})")
-                keyboard_lib.hook(debug_key_hook)
+                # Debug hook to see what keys are detected (helps diagnose mapping issues).
+                # Opt-in only: it writes to the log on the hook thread for every key.
+                if os.getenv("CTRL_AI_KEY_DEBUG"):
+                    def debug_key_hook(event):
+                        logging.debug(f"KEY_EVENT: {event.name} ({event.event_type})")
+                    keyboard_lib.hook(debug_key_hook)
 
                 logging.info("Registering hotkey: ctrl+space")
-                keyboard_lib.add_hotkey('ctrl+space', self.on_commander)
+                keyboard_lib.add_hotkey('ctrl+space', self.dispatcher.callback("commander"))
                 
                 logging.info("Registering hotkey: ctrl+alt+e")
-                keyboard_lib.add_hotkey('ctrl+alt+e', self.on_explain)
+                keyboard_lib.add_hotkey('ctrl+alt+e', self.dispatcher.callback("explain"))
+
+                logging.info("Registering hotkey: ctrl+shift+space")
+                keyboard_lib.add_hotkey('ctrl+shift+space', self.dispatcher.callback("stack"))
+
+                for macro in self.macros:
+                    logging.info(f"Registering macro hotkey: {macro.hotkey}")
+                    keyboard_lib.add_hotkey(macro.hotkey, self.dispatcher.callback(macro.name))
                 
                 logging.info("Waiting for hotkeys...")
                 keyboard_lib.wait()
@@ -268,9 +603,12 @@ class CtrlAIApp:
             
             # pynput format: <modifier>+<key>
             hotkeys = {
-                '<ctrl>+<space>': self.on_commander,
-                '<ctrl>+<alt>+e': self.on_explain
+                '<ctrl>+<space>': self.dispatcher.callback("commander"),
+                '<ctrl>+<alt>+e': self.dispatcher.callback("explain"),
+                '<ctrl>+<shift>+<space>': self.dispatcher.callback("stack")
             }
+            for macro in self.macros:
+                hotkeys[macro.pynput_hotkey] = self.dispatcher.callback(macro.name)
             
             with pynput_keyboard.GlobalHotKeys(hotkeys) as self.listener:
                 try:
@@ -286,17 +624,32 @@ class CtrlAIApp:
         print("Hotkeys:")
         print("  Commander: Ctrl+Space")
         print("  Explain:   Ctrl+Alt+E")
+        print("  Stack:     Ctrl+Shift+Space (then Ctrl+Space to run on all)")
+        for macro in self.macros:
+            print(f"  Macro:     {macro.hotkey} -> {macro.instruction}")
         print("Press Ctrl+C to exit.")
 
         # Start tray icon in background
         threading.Thread(target=self.run_tray_icon, daemon=True).start()
 
+        # Worker that runs hotkey actions off the listener thread
+        self.dispatcher.start()
+        self.memory.start()
+        if hasattr(self.ai, "start"):
+            self.ai.start()  # Spawn the AI worker now, not on the first hotkey
+        if self.macros:
+            threading.Thread(target=self.warm_macros, name="MacroWarmup", daemon=True).start()
+
         # Start listener in a separate thread so GUI can run in main thread
         listener_thread = threading.Thread(target=self.start_listener)
         listener_thread.daemon = True
         listener_thread.start()
 
         if self.gui:
+            if os.getenv("CTRL_AI_UI_WATCHDOG", "1") != "0":
+                self.watchdog = UIWatchdog(self.gui)
+                self.watchdog.start()
+
             # Blocks main thread
             try:
                 self.gui.start()
@@ -348,12 +701,20 @@ def get_privilege_warning():
     return ""
 
 if __name__ == "__main__":
+    # Single-instance lock; launchers talk to this process through it
+    instance = InstanceServer({})
+    if not instance.acquire():
+        print("Ctrl+AI is already running.")
+        sys.exit(1)
+
     if not is_admin():
         msg = get_privilege_warning()
         print(msg)
         logging.warning(msg)
 
     app = CtrlAIApp()
+    app.instance = instance
+    instance.handlers.update(app.instance_commands())
     try:
         app.start()
     except KeyboardInterrupt:
@@ -0,0 +1,141 @@
+import os
+import gc
+import sys
+import time
+import ctypes
+import logging
+import platform
+import threading
+import tracemalloc
+from app_config import log_dir
+
+# Optional: psutil gives accurate RSS everywhere
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def get_rss_bytes():
+    """Current resident set size of this process in bytes (0 if unknown)."""
+    try:
+        if psutil is not None:
+            return psutil.Process().memory_info().rss
+        system = platform.system()
+        if system == "Linux":
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        if system == "Windows":
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            ctypes.windll.psapi.GetProcessMemoryInfo(
+                ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+            return counters.WorkingSetSize
+        import resource
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return 0
+
+
+class MemoryMonitor:
+    """
+    Memory accounting for the long-running tray daemon.
+
+    - take_snapshot(): tracemalloc snapshot, diffed against the previous one and
+      written as a report next to debug.log.
+    - RSS budget (CTRL_AI_RSS_BUDGET_MB, default 0 = off): a background thread checks
+      RSS every `interval` seconds and runs the registered evictors (cache
+      clearing, dropping retained payloads) when it is over budget.
+    """
+
+    def __init__(self, budget_mb=None, interval=30.0):
+        if budget_mb is None:
+            budget_mb = float(os.getenv("CTRL_AI_RSS_BUDGET_MB", "0"))
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.interval = interval
+        self._evictors = []  # [(name, callable)]
+        self._previous_snapshot = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.evictions = 0
+
+    def register_evictor(self, name, fn):
+        """fn() should release memory it can rebuild later; it runs off the UI thread."""
+        self._evictors.append((name, fn))
+
+    def start(self):
+        if self.budget_bytes <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, name="MemoryMonitor", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            rss = get_rss_bytes()
+            if rss > self.budget_bytes:
+                logging.warning(f"[Memory] RSS {rss / 2**20:.0f} MB over budget "
+                                f"{self.budget_bytes / 2**20:.0f} MB; evicting.")
+                self.enforce_budget()
+
+    def enforce_budget(self):
+        """Runs all evictors and a full GC. Returns RSS freed in bytes."""
+        with self._lock:
+            before = get_rss_bytes()
+            for name, fn in self._evictors:
+                try:
+                    fn()
+                except Exception as e:
+                    logging.error(f"[Memory] Evictor '{name}' failed: {e}")
+            gc.collect()
+            after = get_rss_bytes()
+            self.evictions += 1
+        logging.info(f"[Memory] Eviction: {before / 2**20:.1f} MB -> {after / 2**20:.1f} MB")
+        return before - after
+
+    def take_snapshot(self, top=25):
+        """
+        Takes a tracemalloc snapshot and writes a report (top allocations, or the
+        diff against the previous snapshot) next to the log. Tracing starts on
+        the first call, so the first report is a baseline.
+        Returns the report path.
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            previous, self._previous_snapshot = self._previous_snapshot, snapshot
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"Ctrl+AI memory report {time.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"RSS: {get_rss_bytes() / 2**20:.1f} MB  traced: {current / 2**20:.1f} MB  "
+            f"traced peak: {peak / 2**20:.1f} MB  budget: {self.budget_bytes / 2**20:.0f} MB  "
+            f"evictions: {self.evictions}",
+            "",
+        ]
+        if previous is None:
+            lines.append(f"Baseline: top {top} allocation sites")
+            stats = snapshot.statistics("lineno")[:top]
+        else:
+            lines.append(f"Diff vs previous snapshot: top {top} growth sites")
+            stats = snapshot.compare_to(previous, "lineno")[:top]
+        lines.extend(str(stat) for stat in stats)
+
+        path = os.path.join(log_dir(), f"memory_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        logging.info(f"[Memory] Snapshot written to {path}")
+        return path
@@ -0,0 +1,247 @@
+import os
+import time
+import logging
+import threading
+import pyperclip
+from app_config import load_json, save_json
+from clipboard_utils import (paste_text, send_paste_keys, type_text,
+                             get_focused_app, wait_for_focus, wait_for_input_idle)
+
+# Size thresholds (characters)
+TYPED_MAX_CHARS = int(os.getenv("CTRL_AI_TYPED_MAX_CHARS", "200"))
+LARGE_PAYLOAD_CHARS = int(os.getenv("CTRL_AI_LARGE_PASTE_CHARS", "200000"))
+LARGE_CHUNK_CHARS = 64 * 1024
+TYPED_CHUNK_CHARS = 32
+
+STATS_FILE = "paste_stats.json"
+
+
+class PasteError(Exception):
+    pass
+
+
+class PartialPasteError(PasteError):
+    """Some text was already emitted; falling back would duplicate it."""
+
+
+# ===========================================================================
+#  Backends
+# ===========================================================================
+class PasteBackend:
+    name = "base"
+
+    def supports(self, text):
+        return True
+
+    def estimate_ms(self, text):
+        """Prior latency guess used until real stats exist for an app."""
+        return 50.0
+
+    def paste(self, text, target_window=None):
+        raise NotImplementedError
+
+
+class ClipboardPasteBackend(PasteBackend):
+    """
+    Copy to the clipboard and send Ctrl+V once focus is confirmed. If focus
+    cannot be confirmed it pastes anyway, as before backends existed: the
+    text also stays on the clipboard, so it is never lost.
+    """
+    name = "clipboard"
+
+    def supports(self, text):
+        return len(text) <= LARGE_PAYLOAD_CHARS
+
+    def estimate_ms(self, text):
+        return 30.0
+
+    def paste(self, text, target_window=None):
+        if target_window is not None and not wait_for_focus(target_window, timeout=0.3):
+            logging.warning("[Paste] Target window did not regain focus; pasting anyway.")
+        paste_text(text)
+
+
+class TypedPasteBackend(PasteBackend):
+    """Types short strings key by key, for apps that reject or mangle paste."""
+    name = "typed"
+
+    def supports(self, text):
+        return len(text) <= TYPED_MAX_CHARS
+
+    def estimate_ms(self, text):
+        return 5.0 + 2.0 * len(text)
+
+    def paste(self, text, target_window=None):
+        for i in range(0, len(text), TYPED_CHUNK_CHARS):
+            # Re-check focus between chunks so we never type into another window
+            if target_window is not None and not wait_for_focus(target_window, timeout=0.3):
+                raise (PartialPasteError if i else PasteError)("Focus lost while typing.")
+            type_text(text[i:i + TYPED_CHUNK_CHARS])
+
+
+class ChunkedClipboardPasteBackend(PasteBackend):
+    """
+    Pastes very large payloads as several smaller clipboard pastes. Ctrl+V is
+    handled asynchronously, so before replacing the clipboard with the next
+    chunk it waits until the target app is idle again. Where that cannot be
+    observed it waits a delay scaled by chunk size and the slowest paste seen.
+    """
+    name = "chunked"
+
+    # Fallback wait per full chunk when the target's idleness can't be observed
+    SECONDS_PER_CHUNK = 0.25
+
+    def supports(self, text):
+        return len(text) > LARGE_CHUNK_CHARS
+
+    def estimate_ms(self, text):
+        return 60.0 * (len(text) // LARGE_CHUNK_CHARS + 1)
+
+    def paste(self, text, target_window=None):
+        slowest = 0.0  # Longest observed time for the app to consume one chunk
+        for i, chunk in enumerate(_split_chunks(text, LARGE_CHUNK_CHARS)):
+            if target_window is not None and not wait_for_focus(target_window, timeout=0.3):
+                raise (PartialPasteError if i else PasteError)("Focus lost during chunked paste.")
+            pyperclip.copy(chunk)
+            send_paste_keys()
+            waited = wait_for_input_idle(target_window)
+            if waited is None:
+                delay = max(self.SECONDS_PER_CHUNK * len(chunk) / LARGE_CHUNK_CHARS, 2 * slowest, 0.05)
+                time.sleep(delay)
+            else:
+                slowest = max(slowest, waited)
+        # Leave the whole result on the clipboard, like a normal paste does
+        pyperclip.copy(text)
+
+
+def _split_chunks(text, size):
+    """Splits text into chunks of at most `size`, preferring line boundaries."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            newline = text.rfind("\n", start, end)
+            if newline > start:
+                end = newline + 1
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+# ===========================================================================
+#  Per-app stats
+# ===========================================================================
+class PasteStats:
+    """
+    Error counts and latency EMA per (app, backend, size bucket).
+
+    "ok" only means the backend sent its keystrokes without raising; nothing
+    reads the target app back, so a paste the app silently ignored still
+    counts as ok. The ranking is therefore by speed, with backends that raise
+    (no keyboard controller, focus lost mid-way) pushed back.
+    """
+
+    EMA_ALPHA = 0.3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = load_json(STATS_FILE, default={}) or {}
+
+    @staticmethod
+    def _key(app, backend_name, text):
+        if len(text) <= TYPED_MAX_CHARS:
+            bucket = "short"
+        elif len(text) <= LARGE_CHUNK_CHARS:
+            bucket = "medium"
+        else:
+            bucket = "large"
+        return f"{app or 'unknown'}|{backend_name}|{bucket}"
+
+    def score(self, app, backend, text):
+        """Expected cost in ms (lower is better), penalizing backends that raise."""
+        with self._lock:
+            entry = self._stats.get(self._key(app, backend.name, text))
+        if not entry:
+            return backend.estimate_ms(text)
+        # Laplace-smoothed share of attempts that did not raise
+        success_rate = (entry["ok"] + 1) / (entry["ok"] + entry["fail"] + 2)
+        return entry["ema_ms"] / success_rate
+
+    def record(self, app, backend, text, ok, elapsed_ms):
+        with self._lock:
+            key = self._key(app, backend.name, text)
+            entry = self._stats.setdefault(key, {"ok": 0, "fail": 0, "ema_ms": backend.estimate_ms(text)})
+            entry["ok" if ok else "fail"] += 1
+            if ok:
+                entry["ema_ms"] += self.EMA_ALPHA * (elapsed_ms - entry["ema_ms"])
+            snapshot = dict(self._stats)
+        save_json(STATS_FILE, snapshot)
+
+
+# ===========================================================================
+#  Manager
+# ===========================================================================
+class PasteManager:
+    def __init__(self):
+        self.backends = [ClipboardPasteBackend(), TypedPasteBackend(), ChunkedClipboardPasteBackend()]
+        self.stats = PasteStats()
+
+    def paste(self, text, target_window=None):
+        """
+        Pastes text into the focused app, trying backends in order of their
+        measured cost for that app and falling back to the next on error.
+        Returns the name of the backend that sent the text. If none could,
+        the text is left on the clipboard and PasteError is raised.
+        """
+        if not text:
+            return None
+        app = get_focused_app()
+        candidates = [b for b in self.backends if b.supports(text)]
+        candidates.sort(key=lambda b: self.stats.score(app, b, text))
+
+        last_error = None
+        for backend in candidates:
+            start = time.perf_counter()
+            try:
+                backend.paste(text, target_window)
+            except PartialPasteError as e:
+                self.stats.record(app, backend, text, False, 0.0)
+                self._keep_on_clipboard(text, e)
+                raise
+            except Exception as e:
+                last_error = e
+                logging.warning(f"[Paste] {backend.name} failed for '{app}': {e}")
+                self.stats.record(app, backend, text, False, 0.0)
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.stats.record(app, backend, text, True, elapsed_ms)
+            logging.info(f"[Paste] {backend.name} for '{app}' in {elapsed_ms:.0f} ms")
+            return backend.name
+
+        self._keep_on_clipboard(text, last_error)
+        raise PasteError(f"All paste backends failed: {last_error}")
+
+    @staticmethod
+    def _keep_on_clipboard(text, error):
+        """Last resort: leave the full text on the clipboard for a manual paste."""
+        try:
+            pyperclip.copy(text)
+        except Exception as e:
+            logging.error(f"[Paste] Could not copy the result to the clipboard either: {e}")
+            return
+        logging.warning(f"[Paste] Paste failed ({error}); result left on the clipboard.")
+        print("[Paste] Could not paste the result; it is on the clipboard - press Ctrl+V to paste it.")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def paste(text, target_window=None):
+    """Module-level entry point using a shared PasteManager."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = PasteManager()
+    return _manager.paste(text, target_window)
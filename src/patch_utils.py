@@ -0,0 +1,89 @@
+import re
+
+# Edit-only output format used by Commander's patch mode.
+# The model returns one or more blocks like:
+#
+#   <<<<<<< SEARCH
+#   exact text from the original
+#   =======
+#   replacement text
+#   >>>>>>> REPLACE
+#
+# or the single line NO_CHANGES when nothing needs editing.
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER_MARKER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+NO_CHANGES = "NO_CHANGES"
+
+_BLOCK_RE = re.compile(
+    r"^<{7} SEARCH[ \t]*\r?\n(.*?)^={7}[ \t]*\r?\n(.*?)^>{7} REPLACE[ \t]*$",
+    re.DOTALL | re.MULTILINE,
+)
+_FENCE_RE = re.compile(r"^```[\w-]*[ \t]*$")
+
+
+class PatchError(Exception):
+    """Raised when a model-produced patch cannot be applied safely."""
+
+
+def parse_patch(patch_text):
+    """
+    Parses SEARCH/REPLACE blocks out of the model output.
+    Returns a list of (search, replace) tuples. An empty list means NO_CHANGES.
+    """
+    if patch_text is None:
+        raise PatchError("Empty patch.")
+
+    cleaned = _strip_outer_fence(patch_text.strip())
+    if cleaned == NO_CHANGES:
+        return []
+
+    edits = []
+    for match in _BLOCK_RE.finditer(cleaned + "\n"):
+        search = _strip_block_newline(match.group(1))
+        replace = _strip_block_newline(match.group(2))
+        if not search:
+            raise PatchError("Patch block has an empty SEARCH section.")
+        edits.append((search, replace))
+
+    if not edits:
+        raise PatchError("No SEARCH/REPLACE blocks found in model output.")
+    return edits
+
+
+def apply_patch(original, patch_text):
+    """
+    Applies the model's SEARCH/REPLACE blocks to the original text and returns
+    the full edited text. Every SEARCH section must match the current text
+    exactly once, otherwise PatchError is raised so the caller can fall back
+    to full regeneration.
+    """
+    result = original
+    for search, replace in parse_patch(patch_text):
+        count = result.count(search)
+        if count == 0:
+            raise PatchError(f"SEARCH text not found: '{search[:40]}...'")
+        if count > 1:
+            raise PatchError(f"SEARCH text is ambiguous ({count} matches): '{search[:40]}...'")
+        result = result.replace(search, replace, 1)
+    return result
+
+
+def _strip_outer_fence(text):
+    """
+    Removes a code fence wrapping the whole response. Fence lines inside the
+    blocks are content (e.g. a REPLACE that adds a code block) and are kept.
+    """
+    lines = text.splitlines()
+    if len(lines) >= 2 and _FENCE_RE.match(lines[0]) and lines[-1].strip() == "```":
+        return "\n".join(lines[1:-1]).strip()
+    return text
+
+
+def _strip_block_newline(section):
+    # The regex keeps the newline that precedes the next marker; drop it
+    if section.endswith("\r\n"):
+        return section[:-2]
+    if section.endswith("\n"):
+        return section[:-1]
+    return section
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import marshal
+import logging
+import threading
+from app_config import log_dir
+
+
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler for all threads (listener, workers, Tk loop).
+
+    A daemon thread reads sys._current_frames() every `interval` seconds and
+    counts stacks. On stop it writes, next to debug.log:
+    - <name>.folded: collapsed stacks ("thread;frame;frame count"), the input
+      format of flamegraph.pl / speedscope.
+    - <name>.prof: a cProfile-compatible file (load with pstats or snakeviz),
+      with times estimated from the samples. Each sample is weighted by the
+      wall time since the previous sampling round, which runs longer than
+      `interval` under load (GIL contention, stack walking).
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self._folded = {}   # "thread;a;b;c" -> samples
+        self._self = {}     # code key -> samples where it was the leaf
+        self._total = {}    # code key -> samples where it was on the stack
+        self._edges = {}    # (caller key, callee key) -> samples
+        # Same keys -> seconds of wall time those samples stand for
+        self._self_time = {}
+        self._total_time = {}
+        self._edge_time = {}
+        self.samples = 0
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration=None):
+        """Starts sampling; stops and writes output after `duration` seconds if given."""
+        with self._lock:
+            if self.running:
+                return False
+            self._reset()
+            self._stop_event.clear()
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, args=(duration,),
+                                            name="SamplingProfiler", daemon=True)
+            self._thread.start()
+        logging.info(f"[Profiler] Started ({'%.0f s' % duration if duration else 'until stopped'})")
+        return True
+
+    def stop(self):
+        """Stops sampling and writes the output files. Returns (folded_path, prof_path)."""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        return self._write()
+
+    def _run(self, duration):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration if duration else None
+        last = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(own_id, now - last)
+            last = now
+            if deadline and time.monotonic() >= deadline:
+                self._stop_event.set()
+                self._write()
+                return
+
+    def _sample(self, own_id, weight):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            stack.reverse()  # Root first
+            if not stack:
+                continue
+
+            thread_name = names.get(thread_id, str(thread_id))
+            folded = ";".join([thread_name] + [f"{name} ({os.path.basename(path)}:{line})"
+                                               for path, line, name in stack])
+            with self._lock:
+                self.samples += 1
+                self._folded[folded] = self._folded.get(folded, 0) + 1
+                leaf = stack[-1]
+                self._self[leaf] = self._self.get(leaf, 0) + 1
+                self._self_time[leaf] = self._self_time.get(leaf, 0.0) + weight
+                for key in set(stack):
+                    self._total[key] = self._total.get(key, 0) + 1
+                    self._total_time[key] = self._total_time.get(key, 0.0) + weight
+                for caller, callee in set(zip(stack, stack[1:])):
+                    edge = (caller, callee)
+                    self._edges[edge] = self._edges.get(edge, 0) + 1
+                    self._edge_time[edge] = self._edge_time.get(edge, 0.0) + weight
+
+    def _write(self):
+        with self._lock:
+            if not self.samples:
+                logging.info("[Profiler] No samples collected.")
+                return None, None
+            base = os.path.join(log_dir(), f"profile_{time.strftime('%Y%m%d_%H%M%S')}")
+            folded_path, prof_path = base + ".folded", base + ".prof"
+
+            with open(folded_path, "w", encoding="utf-8") as f:
+                for stack, count in sorted(self._folded.items()):
+                    f.write(f"{stack} {count}\n")
+
+            # pstats format: {func: (primitive calls, calls, tottime, cumtime, {caller: (...)})}
+            stats = {}
+            for key, total in self._total.items():
+                callers = {}
+                for (caller, callee), count in self._edges.items():
+                    if callee == key:
+                        t = self._edge_time[(caller, callee)]
+                        callers[caller] = (count, count, t, t)
+                own = self._self_time.get(key, 0.0)
+                stats[key] = (total, total, own, self._total_time[key], callers)
+            with open(prof_path, "wb") as f:
+                marshal.dump(stats, f)
+
+            samples = self.samples
+            self._reset()
+        logging.info(f"[Profiler] {samples} samples written to {folded_path} and {prof_path}")
+        return folded_path, prof_path
@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import logging
+import threading
+
+# Free-tier quotas; override with CTRL_AI_<PROVIDER>_RPM / _TPM (0 = unlimited)
+DEFAULT_LIMITS = {
+    "gemini": {"rpm": 10, "tpm": 250000},
+    "groq": {"rpm": 30, "tpm": 6000},
+}
+
+# "2m59.56s", "7.66s", "120ms" (Groq/OpenAI-style reset headers)
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+# Retry hints inside 429 error messages ("retry in 17.5s", "retry_delay { seconds: 17 }")
+_RETRY_HINT_RE = re.compile(r"retry(?:[ _-]?after|[ _-]?delay|[ _]in)?\D{0,20}?(\d+(?:\.\d+)?)\s*(ms|s)?",
+                            re.IGNORECASE)
+# Exhausted daily or billing quotas also come back as 429, but waiting seconds won't help
+_HARD_QUOTA_RE = re.compile(r"per[ _-]?day|daily|\b[rt]pd\b|insufficient[ _]quota", re.IGNORECASE)
+
+
+def parse_duration(value):
+    """Seconds from a reset header value ("1m30s", "7.66s", "250ms" or plain seconds)."""
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts) if parts else None
+
+
+def is_rate_limit_error(error):
+    """True for short-lived 429s worth waiting out; daily/billing quota errors fail over instead."""
+    text = f"{type(error).__name__} {error}".lower()
+    if _HARD_QUOTA_RE.search(text):
+        return False
+    return ("429" in text or "rate limit" in text or "ratelimit" in text
+            or "resource_exhausted" in text or "resourceexhausted" in text)
+
+
+def retry_after_from_error(error):
+    """Best-effort retry delay (seconds) from a 429 exception, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers and headers.get("retry-after"):
+        return parse_duration(headers["retry-after"])
+    match = _RETRY_HINT_RE.search(str(error))
+    if match:
+        return float(match.group(1)) * (0.001 if match.group(2) == "ms" else 1.0)
+    return None
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` units, refilled continuously at capacity/period."""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount):
+        """Seconds until `amount` is available (amounts above capacity wait for a full bucket)."""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+
+class ProviderRateLimiter:
+    """
+    Client-side RPM/TPM limiter for one provider.
+
+    acquire() blocks until the request fits both buckets, so bursts queue at
+    the quota ceiling instead of running into 429s. Waiters are served in
+    arrival order. Server feedback tightens the buckets: rate-limit headers
+    (observe_headers) and 429 responses (penalize).
+    """
+
+    def __init__(self, name, rpm=0, tpm=0):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._cond = threading.Condition()
+        self._queue = []  # Tickets in arrival order
+        self._tickets = 0
+        self._blocked_until = 0.0
+        # Metrics
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+
+    def _buckets(self):
+        return [b for b in (self.requests, self.tokens) if b is not None]
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Waits for a slot for a request of ~`tokens` tokens. Returns the queue
+        wait in seconds. Raises TimeoutError if `timeout` passes first.
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        with self._cond:
+            self._tickets += 1
+            ticket = self._tickets
+            self._queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    for bucket in self._buckets():
+                        bucket.refill(now)
+                    wait = self._blocked_until - now
+                    if self._queue[0] == ticket:
+                        if self.requests:
+                            wait = max(wait, self.requests.time_until(1))
+                        if self.tokens:
+                            wait = max(wait, self.tokens.time_until(tokens))
+                        if wait <= 0:
+                            break
+                    elif wait <= 0:
+                        wait = None  # Not our turn; woken when the head leaves
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise TimeoutError(f"{self.name}: rate limit queue wait exceeded {timeout:.0f}s")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+                if self.requests:
+                    self.requests.level -= 1
+                if self.tokens:
+                    self.tokens.level -= tokens
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            with self._cond:
+                self.waits += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            logging.info(f"[RateLimit] {self.name}: queued {waited * 1000:.0f} ms")
+        return waited
+
+    def observe_headers(self, headers):
+        """
+        Adapts to x-ratelimit-* response headers: the server's remaining
+        quota wins whenever it is lower than the local estimate.
+        """
+        if not headers:
+            return
+        with self._cond:
+            now = time.monotonic()
+            for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if bucket is None or remaining is None:
+                    continue
+                try:
+                    remaining = float(remaining)
+                except ValueError:
+                    continue
+                bucket.refill(now)
+                bucket.level = min(bucket.level, remaining)
+                if remaining <= 0:
+                    reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}", ""))
+                    if reset:
+                        self._blocked_until = max(self._blocked_until, now + reset)
+            self._cond.notify_all()
+
+    def penalize(self, retry_after=None):
+        """After a 429: hold all requests for retry_after seconds (default: until one slot refills)."""
+        with self._cond:
+            if retry_after is None:
+                retry_after = 60.0 / self.requests.capacity if self.requests else 5.0
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            for bucket in self._buckets():
+                bucket.level = min(bucket.level, 0.0)
+            self.throttled += 1
+            self._cond.notify_all()
+        logging.warning(f"[RateLimit] {self.name}: 429 received; holding requests for {retry_after:.1f}s")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "waits": self.waits,
+                "avg_wait_ms": round(self.total_wait / self.waits * 1000, 1) if self.waits else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "throttled": self.throttled,
+            }
+
+
+def limiter_for(name):
+    """Limiter with the configured quotas for a provider, or None if it has none."""
+    defaults = DEFAULT_LIMITS.get(name, {})
+    rpm = int(os.getenv(f"CTRL_AI_{name.upper()}_RPM", defaults.get("rpm", 0)))
+    tpm = int(os.getenv(f"CTRL_AI_{name.upper()}_TPM", defaults.get("tpm", 0)))
+    if not rpm and not tpm:
+        return None
+    return ProviderRateLimiter(name, rpm, tpm)
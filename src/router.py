@@ -0,0 +1,184 @@
+import re
+import copy
+import time
+import logging
+import threading
+from app_config import load_json
+
+ROUTING_FILE = "routing.json"
+
+# Used when routing.json is missing. Rules are checked top to bottom; the first
+# match wins. Candidates are tried in order ("ordered") or by live latency
+# ("fastest"); unavailable providers are skipped.
+DEFAULT_ROUTING = {
+    "rules": [
+        {
+            "name": "short-edit",
+            "mode": "commander",
+            "instruction_class": ["edit", "format"],
+            "max_input_tokens": 400,
+            "strategy": "fastest",
+            "candidates": [
+                {"provider": "local"},
+                {"provider": "groq", "model": "llama-3.1-8b-instant"},
+                {"provider": "gemini", "model": "gemini-2.5-flash-lite"},
+            ],
+        },
+        {
+            "name": "long-reasoning",
+            "mode": "explain",
+            "min_input_tokens": 2000,
+            "candidates": [
+                {"provider": "gemini", "model": "gemini-2.5-pro"},
+                {"provider": "groq", "model": "llama-3.3-70b-versatile"},
+            ],
+        },
+        {
+            "name": "default",
+            "candidates": [
+                {"provider": "gemini", "model": "gemini-2.5-flash"},
+                {"provider": "groq", "model": "llama3-70b-8192"},
+                {"provider": "local"},
+            ],
+        },
+    ]
+}
+
+# Keyword classes for instructions, most specific first
+_INSTRUCTION_CLASSES = [
+    ("edit", ("fix", "correct", "grammar", "spelling", "typo", "proofread", "punctuation")),
+    ("format", ("format", "bullet", "uppercase", "lowercase", "capitalize", "indent",
+                "json", "markdown", "table", "sort", "list")),
+    ("translate", ("translate", "translation", "in english", "to english")),
+    ("rewrite", ("rewrite", "rephrase", "professional", "formal", "casual", "tone",
+                 "shorten", "shorter", "summarize", "summarise", "expand", "longer", "simplify")),
+    ("reason", ("explain", "why", "how", "analyze", "analyse", "debug", "review",
+                "refactor", "optimize", "bug", "complexity")),
+]
+
+_OVERRIDE_RE = re.compile(r"^@([\w.-]+)(?::([\w./-]+))?\s+")
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) without a tokenizer."""
+    return len(text or "") // 4 + 1
+
+
+def classify_instruction(instruction):
+    lowered = (instruction or "").lower()
+    for name, keywords in _INSTRUCTION_CLASSES:
+        if any(k in lowered for k in keywords):
+            return name
+    return "other"
+
+
+def split_override(prompt, providers):
+    """
+    Parses a per-request override prefix typed in the overlay, e.g.
+    "@groq:llama-3.1-8b-instant fix grammar" or "@local fix grammar".
+    providers: registered provider names; any other "@word" is left in the
+    prompt as typed ("@team summarize this").
+    Returns (override or None, remaining prompt).
+    """
+    match = _OVERRIDE_RE.match(prompt or "")
+    if not match or match.group(1) not in providers:
+        return None, prompt
+    provider, model = match.group(1), match.group(2)
+    override = f"{provider}:{model}" if model else provider
+    return override, prompt[match.end():]
+
+
+class ModelRouter:
+    """
+    Picks (provider, model) pairs per request from mode, input size,
+    instruction class and live latency stats.
+    """
+
+    EMA_ALPHA = 0.3
+    # A failed route ranks after all healthy ones for this long, then gets retried
+    FAIL_COOLDOWN = 60.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # "provider:model" -> {"ema_ms_per_ktok": float, "fails": int}
+        self.reload()
+
+    def reload(self):
+        """(Re)loads routing.json; falls back to DEFAULT_ROUTING."""
+        config = load_json(ROUTING_FILE, default=None)
+        if not config or not isinstance(config.get("rules"), list):
+            config = copy.deepcopy(DEFAULT_ROUTING)
+        self.rules = config["rules"]
+        logging.info(f"[Router] Loaded {len(self.rules)} routing rules.")
+
+    def route(self, providers, text, mode, instruction, override=None):
+        """
+        Returns [(provider, model)] in preference order.
+        providers: dict name -> BaseProvider (only available ones).
+        override: "provider" or "provider:model" forced for this request.
+        """
+        if override:
+            name, _, model = override.partition(":")
+            if name in providers:
+                return [(providers[name], model or None)]
+            logging.warning(f"[Router] Override '{override}' not available; routing normally.")
+
+        tokens = estimate_tokens(text)
+        instruction_class = classify_instruction(instruction)
+        for rule in self.rules:
+            if not self._matches(rule, mode, tokens, instruction_class):
+                continue
+            candidates = [(providers[c["provider"]], c.get("model"))
+                          for c in rule.get("candidates", [])
+                          if c.get("provider") in providers
+                          and providers[c["provider"]].supports(text, mode)]
+            if not candidates:
+                continue
+            if rule.get("strategy") == "fastest":
+                candidates.sort(key=lambda c: self._score(c[0].name, c[1]))
+            logging.debug(f"[Router] Rule '{rule.get('name')}' ({mode}, {tokens} tok, "
+                          f"{instruction_class}) -> {[(p.name, m) for p, m in candidates]}")
+            return candidates
+        return []
+
+    @staticmethod
+    def _matches(rule, mode, tokens, instruction_class):
+        if rule.get("mode") and rule["mode"] != mode:
+            return False
+        if tokens > rule.get("max_input_tokens", float("inf")):
+            return False
+        if tokens < rule.get("min_input_tokens", 0):
+            return False
+        classes = rule.get("instruction_class")
+        if classes and instruction_class not in classes:
+            return False
+        return True
+
+    def _score(self, provider_name, model):
+        """Sort key: recently failed routes last, then by latency; unknown routes first."""
+        with self._lock:
+            entry = self._stats.get(f"{provider_name}:{model}")
+        if entry is None:
+            return (False, 0.0)  # Unknown routes are tried first so they get measured
+        failing = entry["fails"] > 0 and time.monotonic() - entry["failed_at"] < self.FAIL_COOLDOWN
+        return (failing, entry["ema_ms_per_ktok"])
+
+    def record(self, provider_name, model, elapsed_ms, tokens, ok=True):
+        """Feeds live latency back into 'fastest' rules (normalized per 1k tokens)."""
+        with self._lock:
+            entry = self._stats.setdefault(f"{provider_name}:{model}",
+                                           {"ema_ms_per_ktok": 0.0, "fails": 0, "failed_at": 0.0})
+            if not ok:
+                entry["fails"] += 1
+                entry["failed_at"] = time.monotonic()
+                return
+            per_ktok = elapsed_ms / max(tokens / 1000.0, 0.1)
+            if entry["ema_ms_per_ktok"] == 0.0:
+                entry["ema_ms_per_ktok"] = per_ktok
+            else:
+                entry["ema_ms_per_ktok"] += self.EMA_ALPHA * (per_ktok - entry["ema_ms_per_ktok"])
+            entry["fails"] = 0
+
+    def stats(self):
+        with self._lock:
+            return copy.deepcopy(self._stats)
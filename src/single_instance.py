@@ -0,0 +1,125 @@
+import os
+import sys
+import socket
+import logging
+import secrets
+import threading
+from app_config import load_json, save_json, config_path
+
+# Kept importable without the GUI, hotkey or AI modules: main.py calls
+# hand_off() before loading any of them.
+
+INSTANCE_FILE = "instance.json"
+DEFAULT_PORT = 47651
+COMMANDS = ("show", "reload", "quit")
+
+
+def send_command(command, timeout=0.5):
+    """
+    Sends a command to the running daemon. Returns its reply ("ok" or an
+    error message), or None if no daemon is listening.
+    """
+    info = load_json(INSTANCE_FILE, default=None)
+    if not info:
+        return None
+    try:
+        with socket.create_connection(("127.0.0.1", info["port"]), timeout=timeout) as conn:
+            conn.sendall(f"{info['token']} {command}\n".encode("utf-8"))
+            return conn.makefile("r", encoding="utf-8").readline().strip() or None
+    except (OSError, KeyError, TypeError):
+        return None  # Stale instance.json: the daemon is gone
+
+
+def hand_off(argv):
+    """
+    Launcher side. If a daemon is running, passes it the command from argv
+    (--show, --reload, --quit; a plain relaunch means --show) and returns True,
+    so the caller can exit without loading anything heavy.
+    Returns False if this process should start as the daemon.
+    """
+    commands = [a.lstrip("-") for a in argv if a.lstrip("-") in COMMANDS]
+    command = commands[0] if commands else "show"
+    reply = send_command(command)
+    if reply is not None:
+        print(f"Ctrl+AI is already running ({command}: {reply}).")
+        return True
+    if command != "show":
+        print(f"Ctrl+AI is not running; nothing to {command}.")
+        return True
+    return False
+
+
+class InstanceServer:
+    """
+    Daemon side: the single-instance lock plus a localhost command socket.
+
+    Binding the fixed port is the lock; a second daemon cannot bind it. The
+    port and a random token are published in instance.json so that launchers
+    can find the daemon and other local users cannot drive it.
+    """
+
+    def __init__(self, handlers, port=None):
+        self.handlers = handlers  # command -> callable()
+        self.port = port or int(os.getenv("CTRL_AI_INSTANCE_PORT", str(DEFAULT_PORT)))
+        self.token = secrets.token_hex(16)
+        self._sock = None
+
+    def acquire(self):
+        """Takes the lock. Returns False if another instance holds it."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if sys.platform == "win32":
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        else:
+            # Allows rebinding over TIME_WAIT after a restart; still one listener only
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(("127.0.0.1", self.port))
+            sock.listen(4)
+        except OSError as e:
+            sock.close()
+            logging.warning(f"[Instance] Port {self.port} is taken ({e}); another instance is running.")
+            return False
+        self._sock = sock
+        save_json(INSTANCE_FILE, {"port": self.port, "pid": os.getpid(), "token": self.token})
+        threading.Thread(target=self._serve, name="InstanceServer", daemon=True).start()
+        return True
+
+    def release(self):
+        if self._sock is None:
+            return
+        self._sock.close()
+        self._sock = None
+        info = load_json(INSTANCE_FILE, default=None)
+        if info and info.get("token") == self.token:
+            try:
+                os.remove(config_path(INSTANCE_FILE))
+            except OSError:
+                pass
+
+    def _serve(self):
+        while self._sock is not None:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break  # Released
+            with conn:
+                conn.settimeout(1.0)
+                try:
+                    line = conn.makefile("r", encoding="utf-8").readline().split()
+                    conn.sendall((self._dispatch(line) + "\n").encode("utf-8"))
+                except OSError as e:
+                    logging.warning(f"[Instance] Command connection failed: {e}")
+
+    def _dispatch(self, line):
+        if len(line) != 2 or not secrets.compare_digest(line[0], self.token):
+            return "error: bad token"
+        handler = self.handlers.get(line[1])
+        if handler is None:
+            return f"error: unknown command {line[1]!r}"
+        logging.info(f"[Instance] Command from launcher: {line[1]}")
+        try:
+            handler()
+        except Exception as e:
+            logging.error(f"[Instance] Command '{line[1]}' failed: {e}")
+            return f"error: {e}"
+        return "ok"
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import hmac
+import hashlib
+import secrets
+import logging
+import threading
+import logging.handlers
+from app_config import log_dir
+from router import classify_instruction
+from instruction_cache import normalize_instruction
+
+TRACE_FILE = "trace.jsonl"
+
+
+class TraceRecorder:
+    """
+    Opt-in request trace (CTRL_AI_TRACE=1) for load replay (replay_trace.py).
+
+    One JSON line per request, written next to debug.log and rotated at
+    CTRL_AI_TRACE_MAX_MB. Records are anonymized: no text or instruction is
+    stored, only sizes, the instruction class, timings and outcomes. Texts and
+    instructions are replaced by short keyed hashes. The key is random per
+    process, so repeats within one session stay visible (cache behavior) but
+    the hashes cannot be matched against known strings.
+    """
+
+    def __init__(self, path=None, max_mb=None, backups=3):
+        self.path = path or os.path.join(log_dir(), TRACE_FILE)
+        max_mb = max_mb or float(os.getenv("CTRL_AI_TRACE_MAX_MB", "10"))
+        self._key = os.urandom(16)
+        self._session = secrets.token_hex(4)  # Independent of the key, which must stay secret
+        self._lock = threading.Lock()
+        # A dedicated logger gives size-based rotation and thread-safe appends
+        self._logger = logging.getLogger(f"ctrl_ai.trace.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=int(max_mb * 2**20), backupCount=backups, encoding="utf-8")
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._logger.addHandler(self._handler)
+        self.records = 0
+
+    def _id(self, value):
+        return hmac.new(self._key, value.encode("utf-8", "surrogatepass"), hashlib.sha256).hexdigest()[:12]
+
+    def begin(self, mode, text, instruction):
+        """Starts a record for one request; finish it with end()."""
+        return {
+            "ts": round(time.time(), 3),
+            "session": self._session,
+            "mode": mode,
+            "class": classify_instruction(instruction),
+            "text_id": self._id(text or ""),
+            "instr_id": self._id(normalize_instruction(instruction or "")),
+            "in_chars": len(text or ""),
+            "stages": {},
+            "_start": time.perf_counter(),
+        }
+
+    def stage(self, record, name, start):
+        """Adds the time since `start` (perf_counter) to stage `name` in ms."""
+        self.add(record, name, (time.perf_counter() - start) * 1000)
+
+    def add(self, record, name, ms):
+        record["stages"][name] = round(record["stages"].get(name, 0.0) + ms, 2)
+
+    def end(self, record, result=None, ok=True):
+        record["total_ms"] = round((time.perf_counter() - record.pop("_start")) * 1000, 2)
+        record["out_chars"] = len(result or "")
+        record["ok"] = ok
+        try:
+            self._logger.info(json.dumps(record, separators=(",", ":")))
+            with self._lock:
+                self.records += 1
+        except Exception as e:
+            logging.warning(f"[Trace] Could not write record: {e}")
+
+    def close(self):
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
+
+
+def read_trace(path):
+    """Yields records from a trace file (and its rotated backups, oldest first)."""
+    paths = [f"{path}.{i}" for i in range(9, 0, -1) if os.path.exists(f"{path}.{i}")]
+    if os.path.exists(path):
+        paths.append(path)
+    for p in paths:
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logging.warning(f"[Trace] Skipping malformed line in {p}")
@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+
+# Upper bounds (ms) of the lag histogram buckets
+LAG_BUCKETS_MS = (16, 50, 100, 250, 500, 1000, 2000, float("inf"))
+
+
+class UIWatchdog:
+    """
+    Detects Tk main-loop stalls.
+
+    A heartbeat scheduled with gui.after() records how late each tick runs
+    (event-loop lag) into a histogram. A separate monitor thread notices when
+    the heartbeat stops arriving for longer than `threshold` and captures the
+    main thread's stack via sys._current_frames(), so blocking calls on the
+    UI thread show up with the exact line that blocked.
+    """
+
+    def __init__(self, gui, interval=None, threshold=None, max_stalls=50):
+        self.gui = gui
+        self.interval = interval or 0.1
+        if threshold is None:
+            threshold = int(os.getenv("CTRL_AI_UI_STALL_MS", "250")) / 1000.0
+        self.threshold = threshold
+        self.max_stalls = max_stalls
+        self.histogram = [0] * len(LAG_BUCKETS_MS)
+        self.max_lag_ms = 0.0
+        self.stalls = []  # [{"started", "duration_ms", "stack"}]
+        self._lock = threading.Lock()
+        self._main_thread_id = None
+        self._last_beat = None
+        self._expected = None
+        self._open_stall = None
+        self._running = False
+
+    def start(self):
+        """Call from the Tk (main) thread before or inside mainloop."""
+        self._main_thread_id = threading.get_ident()
+        self._running = True
+        now = time.monotonic()
+        self._last_beat = now
+        self._expected = now + self.interval
+        self.gui.after(int(self.interval * 1000), self._beat)
+        threading.Thread(target=self._monitor, name="UIWatchdog", daemon=True).start()
+
+    def stop(self):
+        self._running = False
+
+    # --- Tk thread ---
+    def _beat(self):
+        if not self._running:
+            return
+        now = time.monotonic()
+        lag_ms = max(0.0, (now - self._expected) * 1000)
+        with self._lock:
+            for i, bound in enumerate(LAG_BUCKETS_MS):
+                if lag_ms <= bound:
+                    self.histogram[i] += 1
+                    break
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if self._open_stall is not None:
+                self._open_stall["duration_ms"] = lag_ms
+                logging.warning(f"[UI] Stall ended after {self._open_stall['duration_ms']:.0f} ms")
+                self._open_stall = None
+            self._last_beat = now
+            self._expected = now + self.interval
+        self.gui.after(int(self.interval * 1000), self._beat)
+
+    # --- Monitor thread ---
+    def _monitor(self):
+        while self._running:
+            time.sleep(self.interval / 2)
+            with self._lock:
+                late = time.monotonic() - self._last_beat - self.interval
+                if late < self.threshold or self._open_stall is not None:
+                    continue
+            frame = sys._current_frames().get(self._main_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            with self._lock:
+                stall = {
+                    "started": time.strftime("%H:%M:%S"),
+                    "duration_ms": None,  # Filled in when the loop recovers
+                    "stack": stack,
+                }
+                self._open_stall = stall
+                self.stalls.append(stall)
+                del self.stalls[:-self.max_stalls]
+            logging.warning(f"[UI] Main loop stalled > {self.threshold * 1000:.0f} ms at:\n{stack}")
+
+    # --- Reporting ---
+    def assert_within(self, budget_ms):
+        """For tests: raises AssertionError if any tick lagged beyond budget_ms."""
+        if self.max_lag_ms > budget_ms:
+            raise AssertionError(f"UI thread blocked for {self.max_lag_ms:.0f} ms (budget {budget_ms} ms)")
+
+    def report(self):
+        with self._lock:
+            histogram = list(self.histogram)
+            stalls = [dict(s) for s in self.stalls]
+            max_lag = self.max_lag_ms
+        lines = [f"UI event-loop lag (max {max_lag:.0f} ms, {sum(histogram)} ticks):"]
+        previous = 0
+        for bound, count in zip(LAG_BUCKETS_MS, histogram):
+            label = f"{previous}-{bound:.0f} ms" if bound != float("inf") else f"> {previous} ms"
+            lines.append(f"  {label:>14}: {count}")
+            previous = int(bound) if bound != float("inf") else previous
+        lines.append(f"Stalls captured: {len(stalls)}")
+        for stall in sorted(stalls, key=lambda s: s["duration_ms"] or 0, reverse=True)[:5]:
+            duration = f"{stall['duration_ms']:.0f} ms" if stall["duration_ms"] else "ongoing"
+            lines.append(f"--- {stall['started']} ({duration}) ---")
+            lines.append(stall["stack"].rstrip())
+        return "\n".join(lines)
@@ -0,0 +1,58 @@
+import time
+import pytest
+from ui_watchdog import UIWatchdog
+
+ctk = pytest.importorskip("customtkinter")
+pytest.importorskip("pyperclip")
+import tkinter
+import gui
+
+# Same as the watchdog's default stall threshold (CTRL_AI_UI_STALL_MS)
+BUDGET_MS = 250
+
+
+@pytest.fixture
+def root():
+    try:
+        app = ctk.CTk()
+    except tkinter.TclError as e:
+        pytest.skip(f"no display: {e}")
+    app.withdraw()
+    yield app
+    app.destroy()
+
+
+def run_loop(root, seconds):
+    """Runs the Tk loop for `seconds` under a watchdog; returns the watchdog."""
+    watchdog = UIWatchdog(root, interval=0.02, threshold=0.2)
+    watchdog.start()
+    root.after(int(seconds * 1000), root.quit)
+    root.mainloop()
+    watchdog.stop()
+    return watchdog
+
+
+def test_diff_accept_never_blocks_the_ui(root):
+    pasted = []
+
+    def slow_paste(text):
+        time.sleep(0.3)  # Focus wait + keystrokes happen off the Tk thread
+        pasted.append(text)
+
+    window = gui.DiffWindow(root, "old text", "new text", slow_paste, target_window=None)
+    root.after(100, window._accept)
+    watchdog = run_loop(root, 1.2)
+
+    assert pasted == ["new text"]
+    assert window._state == "done"
+    watchdog.assert_within(BUDGET_MS)
+
+
+def test_processing_toast_within_budget(root):
+    toasts = []
+    root.after(50, lambda: toasts.append(gui.ProcessingToast(root, "Working...")))
+    root.after(300, lambda: toasts[0].hide())
+    watchdog = run_loop(root, 0.6)
+
+    assert toasts
+    watchdog.assert_within(BUDGET_MS)
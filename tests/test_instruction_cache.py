@@ -0,0 +1,59 @@
+import pytest
+from instruction_cache import InstructionCache, normalize_instruction
+
+TEXT = "The quick brown fox jumps over the lazy dog."
+
+
+@pytest.fixture
+def cache():
+    return InstructionCache(max_entries=16, threshold=0.65)
+
+
+def test_normalize_drops_filler_and_keeps_order():
+    assert normalize_instruction("Fix the grammar") == normalize_instruction("fixing grammar")
+    assert normalize_instruction("translate english to french") != \
+        normalize_instruction("translate french to english")
+
+
+@pytest.mark.parametrize("first, second", [
+    ("translate english to french", "translate french to english"),
+    ("replace foo with bar", "replace bar with foo"),
+    ("make it formal", "make it informal"),
+    ("make it formal", "make it more formal"),
+    ("Translate to Spanish", "Translate to French"),
+    ("Translate to Spanish", "Translate to Danish"),
+    ("sort ascending", "sort descending"),
+    ("increase indent", "decrease indent"),
+    ("serialize", "deserialize"),
+    ("convert to python2", "convert to python3"),
+])
+def test_different_instructions_miss(cache, first, second):
+    cache.put(TEXT, "commander", first, "first answer")
+    result, outcome = cache.get(TEXT, "commander", second)
+    assert (result, outcome) == (None, "miss")
+
+
+@pytest.mark.parametrize("first, second, outcome", [
+    ("Fix grammar", "fix the grammar", "exact"),
+    ("summarize", "summarise", "semantic"),
+    ("explain this regex", "explain this regexp", "semantic"),
+    ("fix grammar", "grammar fix", "semantic"),
+    ("summarizes the changes", "summarises the changes", "semantic"),
+])
+def test_equivalent_instructions_hit(cache, first, second, outcome):
+    cache.put(TEXT, "commander", first, "answer")
+    assert cache.get(TEXT, "commander", second) == ("answer", outcome)
+
+
+def test_other_text_or_mode_misses(cache):
+    cache.put(TEXT, "commander", "fix grammar", "answer")
+    assert cache.get(TEXT + " ", "commander", "fix grammar")[1] == "miss"
+    assert cache.get(TEXT, "explain", "fix grammar")[1] == "miss"
+
+
+def test_lru_eviction():
+    cache = InstructionCache(max_entries=2)
+    for i in range(3):
+        cache.put(f"text {i}", "commander", "fix grammar", str(i))
+    assert len(cache) == 2
+    assert cache.get("text 0", "commander", "fix grammar")[1] == "miss"
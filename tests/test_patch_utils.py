@@ -0,0 +1,53 @@
+import pytest
+from patch_utils import PatchError, apply_patch, parse_patch
+
+ORIGINAL = "line one\nline two\nline three\n"
+
+
+def block(search, replace):
+    return f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE"
+
+
+def test_single_block():
+    assert apply_patch(ORIGINAL, block("line two", "line 2")) == "line one\nline 2\nline three\n"
+
+
+def test_multiple_blocks_and_deletion():
+    patch = block("line one", "first") + "\n" + block("line three\n", "")
+    assert apply_patch(ORIGINAL, patch) == "first\nline two\n"
+
+
+def test_no_changes():
+    assert parse_patch("NO_CHANGES") == []
+    assert apply_patch(ORIGINAL, "```\nNO_CHANGES\n```") == ORIGINAL
+
+
+def test_outer_fence_is_stripped():
+    patch = "```diff\n" + block("line two", "line 2") + "\n```"
+    assert apply_patch(ORIGINAL, patch) == "line one\nline 2\nline three\n"
+
+
+def test_fences_inside_blocks_are_kept():
+    replacement = "line two\n```python\nprint('hi')\n```"
+    patch = block("line two", replacement)
+    assert apply_patch(ORIGINAL, patch) == f"line one\n{replacement}\nline three\n"
+    # Also when the whole response is fenced as well
+    assert apply_patch(ORIGINAL, f"```\n{patch}\n```") == f"line one\n{replacement}\nline three\n"
+
+
+def test_crlf_blocks():
+    patch = block("line two", "line 2").replace("\n", "\r\n")
+    assert apply_patch(ORIGINAL, patch) == "line one\nline 2\nline three\n"
+
+
+@pytest.mark.parametrize("patch", [
+    None,
+    "",
+    "Sure! Here is the edited text.",
+    block("not in the text", "x"),
+    block("line", "x"),  # Ambiguous
+    block("", "x"),
+])
+def test_bad_patches_raise(patch):
+    with pytest.raises(PatchError):
+        apply_patch(ORIGINAL, patch)
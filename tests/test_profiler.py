@@ -0,0 +1,43 @@
+import time
+import pstats
+import threading
+import pytest
+import profiler
+from profiler import SamplingProfiler
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(200))
+
+
+@pytest.fixture(autouse=True)
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "log_dir", lambda: str(tmp_path))
+    return tmp_path
+
+
+def test_prof_times_match_wall_time():
+    prof = SamplingProfiler()
+    prof.start()
+    worker = threading.Thread(target=busy_loop, args=(0.5,))
+    worker.start()
+    worker.join()
+    _, prof_path = prof.stop()
+
+    stats = pstats.Stats(prof_path).stats
+    key = next(k for k in stats if k[2] == "busy_loop")
+    cumtime = stats[key][3]
+    assert 0.4 <= cumtime <= 0.7
+
+
+def test_folded_output(log_dir):
+    prof = SamplingProfiler()
+    prof.start()
+    worker = threading.Thread(target=busy_loop, args=(0.1,), name="Busy")
+    worker.start()
+    worker.join()
+    folded_path, _ = prof.stop()
+    lines = open(folded_path, encoding="utf-8").read().splitlines()
+    assert any(line.startswith("Busy;") and "busy_loop" in line for line in lines)
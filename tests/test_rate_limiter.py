@@ -0,0 +1,86 @@
+import pytest
+from rate_limiter import (ProviderRateLimiter, TokenBucket, is_rate_limit_error,
+                          parse_duration, retry_after_from_error)
+
+
+class FakeAPIError(Exception):
+    pass
+
+
+@pytest.mark.parametrize("message", [
+    "429 Too Many Requests",
+    "RESOURCE_EXHAUSTED: retry in 17s",
+    "Rate limit reached for model llama-3.1-8b-instant on requests per minute (RPM)",
+])
+def test_transient_rate_limits_are_retried(message):
+    assert is_rate_limit_error(FakeAPIError(message))
+
+
+@pytest.mark.parametrize("message", [
+    "429 RESOURCE_EXHAUSTED. You exceeded your current quota. "
+    "quotaId: GenerateRequestsPerDayPerProjectPerModel-FreeTier",
+    "429 Rate limit reached on tokens per day (TPD): Limit 500000",
+    "429 insufficient_quota: check your plan and billing details",
+])
+def test_daily_and_billing_quotas_fail_over(message):
+    assert not is_rate_limit_error(FakeAPIError(message))
+
+
+def test_unrelated_errors():
+    assert not is_rate_limit_error(FakeAPIError("500 Internal Server Error"))
+    assert not is_rate_limit_error(ValueError("quota field missing in config"))
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("7.66s", 7.66),
+    ("2m59.56s", 179.56),
+    ("120ms", 0.12),
+    ("1h", 3600.0),
+    ("30", 30.0),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds)
+
+
+def test_parse_duration_rejects_garbage():
+    assert parse_duration("soon") is None
+
+
+def test_retry_after_from_header_and_message():
+    error = FakeAPIError("429")
+    error.response = type("Response", (), {"headers": {"retry-after": "3"}})()
+    assert retry_after_from_error(error) == 3.0
+    assert retry_after_from_error(FakeAPIError("Please retry in 17.5s.")) == 17.5
+    assert retry_after_from_error(FakeAPIError("retry_delay { seconds: 12 }")) == 12.0
+    assert retry_after_from_error(FakeAPIError("429 Too Many Requests")) is None
+
+
+def test_token_bucket_refill():
+    bucket = TokenBucket(60, period=60.0)  # 1 unit per second
+    bucket.level = 0.0
+    assert bucket.time_until(2) == pytest.approx(2.0)
+    bucket.refill(bucket.updated + 1.5)
+    assert bucket.level == pytest.approx(1.5)
+    assert bucket.time_until(1000) == pytest.approx(58.5)  # Capped at a full bucket
+
+
+def test_acquire_queues_at_the_rpm_ceiling():
+    limiter = ProviderRateLimiter("test", rpm=600)  # One request per 0.1 s after the burst
+    limiter.requests.level = 1.0
+    assert limiter.acquire() < 0.01
+    assert limiter.acquire() == pytest.approx(0.1, abs=0.05)
+    assert limiter.stats()["waits"] == 1
+
+
+def test_acquire_times_out():
+    limiter = ProviderRateLimiter("test", rpm=1)
+    limiter.requests.level = 0.0
+    with pytest.raises(TimeoutError):
+        limiter.acquire(timeout=0.05)
+
+
+def test_penalize_holds_requests():
+    limiter = ProviderRateLimiter("test", tpm=1_000_000)
+    limiter.penalize(0.1)
+    assert limiter.acquire(10) >= 0.09
+    assert limiter.stats()["throttled"] == 1
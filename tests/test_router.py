@@ -0,0 +1,67 @@
+import pytest
+from router import ModelRouter, classify_instruction, split_override
+
+PROVIDERS = {"gemini", "groq", "local"}
+
+
+class StubProvider:
+    def __init__(self, name):
+        self.name = name
+
+    def supports(self, text, mode):
+        return True
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr("router.load_json", lambda name, default=None: default)  # DEFAULT_ROUTING
+    return ModelRouter()
+
+
+@pytest.mark.parametrize("prompt, expected", [
+    ("@groq:llama-3.1-8b-instant fix grammar", ("groq:llama-3.1-8b-instant", "fix grammar")),
+    ("@local fix grammar", ("local", "fix grammar")),
+    ("@team summarize this", (None, "@team summarize this")),
+    ("fix grammar", (None, "fix grammar")),
+])
+def test_split_override(prompt, expected):
+    assert split_override(prompt, PROVIDERS) == expected
+
+
+def test_classify_instruction():
+    assert classify_instruction("Fix the grammar") == "edit"
+    assert classify_instruction("Translate to English") == "translate"
+    assert classify_instruction("Why is this slow?") == "reason"
+    assert classify_instruction("haiku please") == "other"
+
+
+def test_short_edit_prefers_measured_fastest(router):
+    providers = {name: StubProvider(name) for name in PROVIDERS}
+    router.record("groq", "llama-3.1-8b-instant", 300, 1000)
+    router.record("gemini", "gemini-2.5-flash-lite", 900, 1000)
+    chain = router.route(providers, "teh cat", "commander", "fix grammar")
+    # local was never measured, so it is tried first
+    assert [p.name for p, _ in chain] == ["local", "groq", "gemini"]
+
+
+def test_failed_route_ranks_after_healthy_ones(router):
+    providers = {name: StubProvider(name) for name in ("groq", "gemini")}
+    router.record("gemini", "gemini-2.5-flash-lite", 300, 1000)
+    for _ in range(2):
+        router.record("groq", "llama-3.1-8b-instant", 0.0, 1000, ok=False)
+    chain = router.route(providers, "teh cat", "commander", "fix grammar")
+    assert [p.name for p, _ in chain] == ["gemini", "groq"]
+
+
+def test_failed_route_recovers_after_cooldown(router, monkeypatch):
+    providers = {name: StubProvider(name) for name in ("groq", "gemini")}
+    router.record("gemini", "gemini-2.5-flash-lite", 900, 1000)
+    router.record("groq", "llama-3.1-8b-instant", 0.0, 1000, ok=False)
+    monkeypatch.setattr(ModelRouter, "FAIL_COOLDOWN", 0.0)
+    chain = router.route(providers, "teh cat", "commander", "fix grammar")
+    assert chain[0][0].name == "groq"
+
+
+def test_override_wins(router):
+    providers = {name: StubProvider(name) for name in PROVIDERS}
+    assert [(p.name, m) for p, m in router.route(providers, "x", "commander", "fix", "groq:m")] == [("groq", "m")]
@@ -0,0 +1,65 @@
+import time
+import heapq
+import itertools
+import pytest
+from ui_watchdog import UIWatchdog
+
+
+class FakeTk:
+    """Just enough of Tk for the watchdog: after() plus a loop run on this thread."""
+
+    def __init__(self):
+        self._timers = []
+        self._ids = itertools.count()
+
+    def after(self, ms, callback):
+        heapq.heappush(self._timers, (time.monotonic() + ms / 1000, next(self._ids), callback))
+
+    def run(self, seconds):
+        end = time.monotonic() + seconds
+        while self._timers and time.monotonic() < end:
+            due, _, callback = heapq.heappop(self._timers)
+            time.sleep(max(0.0, due - time.monotonic()))
+            callback()
+
+
+def block_ui_thread():
+    time.sleep(0.6)
+
+
+@pytest.fixture
+def gui():
+    return FakeTk()
+
+
+@pytest.fixture
+def watchdog(gui):
+    dog = UIWatchdog(gui, interval=0.02, threshold=0.2)
+    dog.start()
+    yield dog
+    dog.stop()
+
+
+def test_idle_loop_stays_within_budget(gui, watchdog):
+    gui.run(0.3)
+    watchdog.assert_within(100)
+    assert sum(watchdog.histogram) > 5
+    assert watchdog.stalls == []
+
+
+def test_blocking_callback_breaks_budget(gui, watchdog):
+    gui.after(50, block_ui_thread)
+    gui.run(0.9)
+    with pytest.raises(AssertionError, match="UI thread blocked"):
+        watchdog.assert_within(250)
+    assert watchdog.max_lag_ms >= 500
+
+
+def test_stall_captures_the_blocking_line(gui, watchdog):
+    gui.after(50, block_ui_thread)
+    gui.run(0.9)
+    assert len(watchdog.stalls) == 1
+    stall = watchdog.stalls[0]
+    assert "block_ui_thread" in stall["stack"]
+    assert stall["duration_ms"] >= 500  # Closed once the loop recovered
+    assert "Stalls captured: 1" in watchdog.report()